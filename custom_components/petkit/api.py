@@ -0,0 +1,333 @@
+"""Petkit cloud API client."""
+import copy
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import datetime
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant
+from homeassistant.const import (
+    CONF_DEVICES,
+    CONF_PASSWORD,
+    CONF_SCAN_INTERVAL,
+    CONF_TOKEN,
+    CONF_USERNAME,
+)
+from homeassistant.helpers import aiohttp_client
+from homeassistant.helpers.storage import Store
+from homeassistant.util.json import json_loads
+import homeassistant.helpers.config_validation as cv
+
+from asyncio import TimeoutError
+from aiohttp import ClientError, ClientResponseError
+
+from .const import (
+    DOMAIN,
+    SCAN_INTERVAL,
+    RESPONSE_CACHE_SIZE,
+    PUSH_SCAN_INTERVAL,
+    CONF_API_BASE,
+    CONF_USER_ID,
+    CONF_MAX_REQUESTS,
+    CONF_PUSH_URL,
+    CONF_PUSH_INTERVAL,
+    CONF_LOCAL_URL,
+    CONF_LOCAL_DEVICES,
+    CONF_FAST_JSON,
+    CONF_CAPTURE,
+    CONF_REPLAY,
+    CONF_REPLAY_SPEED,
+    DEFAULT_API_BASE,
+)
+from .capture import ReplayTransport, TrafficCapture, request_key
+from .profiler import profile_phase
+from .push import create_push_transport
+from .transport import CloudBases, HttpTransport, LOCAL_TIMEOUT, not_sent
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def parse_interval(val, default: datetime.timedelta):
+    if not val:
+        return default
+    try:
+        return cv.time_period(val)
+    except vol.Invalid:
+        return default
+
+
+class PetkitAccount:
+    def __init__(self, hass: HomeAssistant, config: dict):
+        self._config = config
+        self.hass = hass
+        # decompress ourselves so the bytes on the wire can be accounted for
+        self.http = aiohttp_client.async_create_clientsession(hass, auto_cleanup=False, auto_decompress=False)
+        self.traffic = {}
+        self.traffic_since = datetime.datetime.now()
+        self._semaphore = asyncio.Semaphore(self.get_config(CONF_MAX_REQUESTS) or 4)
+        self._responses = {}
+        self._ttl_cache = {}
+        self.profiler = None
+        self._json_loads = json_loads if self.get_config(CONF_FAST_JSON) else json.loads
+        self.cloud = CloudBases(self, cv.ensure_list(self.get_config(CONF_API_BASE)) or [DEFAULT_API_BASE])
+        self.transports = {
+            'cloud': self.cloud.transports[0],
+        }
+        if url := self._config.get(CONF_LOCAL_URL):
+            self.transports['local'] = HttpTransport(self, url, 'local', timeout=LOCAL_TIMEOUT, strict=True)
+        self.replay = None
+        if pth := self._config.get(CONF_REPLAY):
+            self.replay = ReplayTransport(self, hass.config.path(pth), self._config.get(CONF_REPLAY_SPEED, 1.0))
+        self.capture = None
+        if cap := self._config.get(CONF_CAPTURE):
+            pth = cap if isinstance(cap, str) else f'{DOMAIN}-capture-{self.username}.jsonl'
+            self.capture = TrafficCapture(self, hass.config.path(pth))
+        self.push = None
+        if url := self._config.get(CONF_PUSH_URL):
+            self.push = create_push_transport(self, url)
+
+    def get_config(self, key, default=None):
+        return self._config.get(key, self.hass.data[DOMAIN]['config'].get(key, default))
+
+    @property
+    def username(self):
+        return self._config.get(CONF_USERNAME)
+
+    @property
+    def password(self):
+        pwd = self._config.get(CONF_PASSWORD)
+        if len(pwd) != 32:
+            pwd = hashlib.md5(f'{pwd}'.encode()).hexdigest()
+        return pwd
+
+    @property
+    def uid(self):
+        return self._config.get(CONF_USER_ID) or self.username
+
+    @property
+    def token(self):
+        return self._config.get(CONF_TOKEN) or ''
+
+    @property
+    def update_interval(self):
+        return parse_interval(self.get_config(CONF_SCAN_INTERVAL), SCAN_INTERVAL)
+
+    @property
+    def push_interval(self):
+        return parse_interval(self.get_config(CONF_PUSH_INTERVAL), PUSH_SCAN_INTERVAL)
+
+    @property
+    def headers(self):
+        return {
+            'User-Agent': 'okhttp/3.12.1',
+            'X-Api-Version': '7.29.1',
+            'X-Client': 'Android(7.1.1;Xiaomi)',
+            'X-Session': f'{self.token}',
+        }
+
+    def api_url(self, api=''):
+        return self.cloud.best.url(api)
+
+    def route(self, device=None, api=''):
+        """Transports to try for a device, local relay first with cloud fallback."""
+        if self.replay:
+            return [self.replay]
+        if api[:6] == 'https:' or api[:5] == 'http:':
+            return [self.cloud.best]
+        tps = []
+        loc = self.transports.get('local')
+        if loc and loc.available and device:
+            dls = self.get_config(CONF_LOCAL_DEVICES) or []
+            if not dls or f'{device}' in [f'{d}' for d in dls]:
+                tps.append(loc)
+        tps.extend(self.cloud.ordered())
+        return tps
+
+    async def request(self, api, pms=None, method='GET', device=None, idempotent=False, **kwargs):
+        """Send a call via the routed transports, failing over on any error only for idempotent (read-only) calls."""
+        if self.http.closed:
+            # a shared device may still point at an unloaded account until another one adopts it
+            _LOGGER.warning('Request Petkit api via closed account %s skipped: %s', self.username, api)
+            return {}
+        method = method.upper()
+        kws = {
+            'headers': self.headers,
+        }
+        kws.update(kwargs)
+        if method in ['GET']:
+            kws['params'] = pms
+        elif method in ['POST_GET']:
+            method = 'POST'
+            kws['params'] = pms
+        else:
+            kws['data'] = pms
+            kws['headers']['Content-Type'] = 'application/x-www-form-urlencoded'
+        key = None
+        if method == 'GET':
+            key = (api, repr(sorted(pms.items())) if isinstance(pms, dict) else repr(pms))
+        tps = self.route(device, api)
+        for tsp in tps:
+            tim = None
+            try:
+                async with self._semaphore:
+                    # captured timings leave out the queueing, a replay queues again by itself
+                    tim = time.monotonic()
+                    with profile_phase(self, 'network'):
+                        body = await tsp.request(method, api, **kws)
+                if self.capture:
+                    self.capture.record(method, api, pms, time.monotonic() - tim, body)
+                with profile_phase(self, 'decode'):
+                    return self.decode_response(body, key)
+            except (ClientError, TimeoutError, ValueError) as exc:
+                if self.capture:
+                    self.capture.record(method, api, pms, time.monotonic() - tim if tim else 0, error=exc)
+                if tsp is not tps[-1]:
+                    tsp.mark_down()
+                    # a command that may have reached the server is never sent twice
+                    if idempotent or not_sent(exc):
+                        _LOGGER.info('Request Petkit api via %s failed, falling back: %s', tsp.name, [api, exc])
+                        continue
+                lgs = [method, tsp.url(api), pms, exc]
+                if isinstance(exc, ClientResponseError):
+                    lgs.append(exc.status)
+                _LOGGER.error('Request Petkit api failed: %s', lgs)
+                break
+        return {}
+
+    async def batch_request(self, items: list, cache_ttl=0):
+        """Run many api calls concurrently under the request limit, GET results may be reused for cache_ttl seconds."""
+        now = time.monotonic()
+        self._ttl_cache = {
+            k: v
+            for k, v in self._ttl_cache.items()
+            if v[0] > now
+        }
+
+        async def run(itm):
+            api = itm.get('api')
+            pms = itm.get('params')
+            method = (itm.get('method') or 'GET').upper()
+            key = request_key(method, api, pms) if cache_ttl and method == 'GET' else None
+            if key and key in self._ttl_cache:
+                rdt = self._ttl_cache[key][1]
+                cached = True
+            else:
+                rdt = await self.request(api, pms, method)
+                cached = False
+                if key and isinstance(rdt, dict) and 'result' in rdt:
+                    self._ttl_cache[key] = (time.monotonic() + cache_ttl, rdt)
+            return {
+                'api': api,
+                'success': isinstance(rdt, dict) and 'result' in rdt,
+                'cached': cached,
+                # responses leave the integration, the cached objects stay untouched
+                'response': copy.deepcopy(rdt),
+            }
+
+        return await asyncio.gather(*[run(itm) for itm in items])
+
+    async def async_close(self):
+        if self.push:
+            await self.push.stop()
+        if self.capture:
+            await self.capture.async_flush()
+        # the session shares the connector of Home Assistant, which must stay open
+        self.http.detach()
+
+    def record_traffic(self, api, wire: int, decoded: int):
+        api = f'{api}'.split('?')[0].lstrip('/')
+        sta = self.traffic.setdefault(api, {'requests': 0, 'wire': 0, 'decoded': 0})
+        sta['requests'] += 1
+        sta['wire'] += wire
+        sta['decoded'] += decoded
+
+    def traffic_stats(self, reset=False):
+        dat = {
+            'since': f'{self.traffic_since}',
+            'wire': sum(v['wire'] for v in self.traffic.values()),
+            'decoded': sum(v['decoded'] for v in self.traffic.values()),
+            'apis': copy.deepcopy(self.traffic),
+        }
+        if reset:
+            self.traffic.clear()
+            self.traffic_since = datetime.datetime.now()
+        return dat
+
+    def decode_response(self, body: bytes, key=None):
+        """Decode a response body, reusing the parsed object when it is byte-identical to the last one for key.
+
+        The returned object is shared by every caller and must be treated as read-only, copy it before changing it.
+        """
+        dig = hashlib.blake2b(body, digest_size=16).digest() if key else None
+        if key and (old := self._responses.get(key)) and old[0] == dig:
+            return old[1]
+        dat = self._json_loads(body) if body else None
+        dat = dat or {}
+        if key:
+            self._responses.pop(key, None)
+            self._responses[key] = (dig, dat)
+            while len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.pop(next(iter(self._responses)))
+        return dat
+
+    async def async_login(self):
+        pms = {
+            'encrypt': 1,
+            'username': self.username,
+            'password': self.password,
+            'oldVersion': '',
+        }
+        rsp = await self.request(f'user/login', pms, 'POST_GET', idempotent=True)
+        ssn = rsp.get('result', {}).get('session') or {}
+        sid = ssn.get('id')
+        if not sid:
+            _LOGGER.error('Petkit login %s failed: %s', self.username, rsp)
+            return False
+        self._config.update({
+            CONF_TOKEN: sid,
+            CONF_USER_ID: ssn.get('userId'),
+        })
+        await self.async_check_auth(True)
+        return True
+
+    async def async_check_auth(self, save=False):
+        fnm = f'{DOMAIN}/auth-{self.username}.json'
+        sto = Store(self.hass, 1, fnm)
+        old = await sto.async_load() or {}
+        if save:
+            cfg = {
+                CONF_USERNAME: self.username,
+                CONF_USER_ID: self.uid,
+                CONF_TOKEN: self.token,
+            }
+            if cfg.get(CONF_TOKEN) == old.get(CONF_TOKEN):
+                cfg['update_at'] = old.get('update_at')
+            else:
+                cfg['update_at'] = f'{datetime.datetime.today()}'
+            await sto.async_save(cfg)
+            return cfg
+        if old.get(CONF_TOKEN):
+            self._config.update({
+                CONF_TOKEN: old.get(CONF_TOKEN),
+                CONF_USER_ID: old.get(CONF_USER_ID),
+            })
+        else:
+            await self.async_login()
+        return old
+
+    async def get_devices(self):
+        api = 'discovery/device_roster'
+        rsp = await self.request(api, idempotent=True)
+        eno = rsp.get('error', {}).get('code', 0)
+        if eno in [5, 8]:
+            with profile_phase(self, 'auth'):
+                ok = await self.async_login()
+            if ok:
+                rsp = await self.request(api, idempotent=True)
+        dls = rsp.get('result', {}).get(CONF_DEVICES) or []
+        if not dls:
+            _LOGGER.warning('Got petkit devices for %s failed: %s', self.username, rsp)
+        return dls
@@ -0,0 +1,97 @@
+"""Fan-out of device snapshots and events to a local MQTT broker."""
+import json
+import hashlib
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+LISTENER_KEY = 'mqtt_bridge'
+
+
+class MqttBridge:
+    """Publishes retained data/detail snapshots when they change, and new litter and feed events."""
+
+    def __init__(self, coordinator, prefix: str):
+        self.coordinator = coordinator
+        self.hass = coordinator.hass
+        self.prefix = prefix.strip('/')
+        self._digests = {}
+        self._marks = {}
+        self._warned = False
+
+    def attach(self, dvc):
+        if LISTENER_KEY in dvc.listeners:
+            return
+        # the first publish follows the first notify, by then the detail is usually fetched
+        dvc.listeners[LISTENER_KEY] = lambda: self.publish_device(dvc)
+        # the whole detail is published, optional endpoints are fetched even without entities using them
+        dvc.consumers[LISTENER_KEY] = list(dvc.detail_endpoints)
+
+    def detach(self, dvc):
+        """Forget a device retired or handed to another account."""
+        dvc.listeners.pop(LISTENER_KEY, None)
+        dvc.consumers.pop(LISTENER_KEY, None)
+        self._marks.pop(dvc.device_id, None)
+        pfx = f'{self.prefix}/{dvc.device_id}/'
+        for topic in [t for t in self._digests if t.startswith(pfx)]:
+            self._digests.pop(topic)
+
+    @staticmethod
+    def event_marks(dvc):
+        rls = [
+            r.get('timestamp') or 0
+            for r in getattr(dvc.parsed, 'records', None) or []
+            if isinstance(r, dict)
+        ]
+        return {
+            'record': max(rls) if rls else 0,
+            'feed_times': getattr(dvc.parsed, 'feed_times', 0) or 0,
+        }
+
+    def new_events(self, dvc):
+        old = self._marks.get(dvc.device_id)
+        if old is None:
+            # events in the first detail after startup are history, not news
+            if dvc.detail:
+                self._marks[dvc.device_id] = self.event_marks(dvc)
+            return []
+        new = self.event_marks(dvc)
+        evs = []
+        if new['record'] > old['record']:
+            evs.extend([
+                {'type': 'record', **r}
+                for r in dvc.parsed.records
+                if isinstance(r, dict) and (r.get('timestamp') or 0) > old['record']
+            ])
+        if new['feed_times'] > old['feed_times']:
+            evs.append({
+                'type': 'feed',
+                'times': new['feed_times'],
+                'amount': dvc.parsed.feed_amount,
+                'state': dvc.parsed.feed_state,
+            })
+        # feed counters roll over at midnight, the lower count becomes the new mark
+        self._marks[dvc.device_id] = new
+        return evs
+
+    def publish_device(self, dvc):
+        if 'mqtt' not in self.hass.config.components:
+            if not self._warned:
+                _LOGGER.warning('Petkit mqtt bridge needs the mqtt integration to be set up')
+                self._warned = True
+            return
+        did = dvc.device_id
+        self.publish(f'{self.prefix}/{did}/data', dvc.data, retain=True)
+        self.publish(f'{self.prefix}/{did}/detail', dvc.detail, retain=True)
+        for evt in self.new_events(dvc):
+            self.publish(f'{self.prefix}/{did}/event', evt, retain=False, changed_only=False)
+
+    def publish(self, topic, dat, retain=True, changed_only=True):
+        from homeassistant.components import mqtt
+        payload = json.dumps(dat, separators=(',', ':'), sort_keys=True, default=str)
+        if changed_only:
+            dig = hashlib.blake2b(payload.encode(), digest_size=16).digest()
+            if self._digests.get(topic) == dig:
+                return
+            self._digests[topic] = dig
+        self.hass.async_create_task(mqtt.async_publish(self.hass, topic, payload, 0, retain))
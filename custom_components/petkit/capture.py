@@ -0,0 +1,140 @@
+"""Traffic capture and replay for profiling."""
+import json
+import time
+import asyncio
+import logging
+
+from collections import deque
+
+from aiohttp import ClientError
+
+_LOGGER = logging.getLogger(__name__)
+
+REDACTED = '**REDACTED**'
+REDACT_PARAMS = ['password', 'X-Session']
+FLUSH_SIZE = 20
+
+
+def request_key(method, api, pms):
+    api = f'{api}'.lstrip('/')
+    if isinstance(pms, dict):
+        pms = {
+            k: v
+            for k, v in pms.items()
+            if k not in REDACT_PARAMS
+        }
+        pms = json.dumps(pms, sort_keys=True, default=str)
+    return f'{method} {api} {pms or ""}'
+
+
+class TrafficCapture:
+    """Appends request/response pairs with timings to a JSON lines log, secrets redacted."""
+
+    def __init__(self, account, path: str):
+        self.account = account
+        self.path = path
+        self._buffer = []
+        self._started = time.time()
+
+    def record(self, method, api, pms, elapsed: float, body: bytes = None, error=None):
+        if isinstance(pms, dict):
+            pms = {
+                k: REDACTED if k in REDACT_PARAMS else v
+                for k, v in pms.items()
+            }
+        txt = None
+        if body is not None:
+            txt = body.decode(errors='replace')
+            if tok := self.account.token:
+                txt = txt.replace(tok, REDACTED)
+            if 'login' in f'{api}':
+                txt = self.redact_session(txt)
+        self._buffer.append({
+            'at': round(time.time() - self._started, 3),
+            'method': method,
+            'api': api,
+            'params': pms,
+            'elapsed': round(elapsed, 4),
+            'body': txt,
+            'error': f'{error}' if error else None,
+        })
+        if len(self._buffer) >= FLUSH_SIZE:
+            self.account.hass.async_create_task(self.async_flush())
+
+    @staticmethod
+    def redact_session(txt: str):
+        try:
+            dat = json.loads(txt)
+            ssn = dat['result']['session']
+        except (ValueError, KeyError, TypeError):
+            return txt
+        if isinstance(ssn, dict) and 'id' in ssn:
+            ssn['id'] = REDACTED
+        return json.dumps(dat)
+
+    async def async_flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        await self.account.hass.async_add_executor_job(self._write, lines)
+
+    def _write(self, lines):
+        with open(self.path, 'a', encoding='utf-8') as fp:
+            for row in lines:
+                fp.write(json.dumps(row, separators=(',', ':'), default=str))
+                fp.write('\n')
+
+
+class ReplayTransport:
+    """Serves a captured log back in place of the network, with original or scaled latencies."""
+
+    def __init__(self, account, path: str, speed=1.0):
+        self.account = account
+        self.path = path
+        self.name = 'replay'
+        self.base = f'replay:{path}'
+        self.speed = speed
+        self.latency = None
+        self.available = True
+        self._responses = None
+        self._loading = asyncio.Lock()
+
+    def url(self, api=''):
+        return f'{self.base}#{api}'
+
+    def mark_down(self, *args, **kwargs):
+        pass
+
+    def load(self):
+        rsp = {}
+        with open(self.path, encoding='utf-8') as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                key = request_key(row['method'], row['api'], row.get('params'))
+                rsp.setdefault(key, deque()).append(row)
+                # fallback for params that differ between runs, like the current day
+                rsp.setdefault(request_key(row['method'], row['api'], None), deque()).append(row)
+        return rsp
+
+    async def request(self, method, api, **kwargs):
+        async with self._loading:
+            # concurrent first requests wait for a single load of the log
+            if self._responses is None:
+                self._responses = await self.account.hass.async_add_executor_job(self.load)
+        pms = kwargs.get('params') if kwargs.get('params') is not None else kwargs.get('data')
+        rls = self._responses.get(request_key(method, api, pms))
+        if not rls:
+            rls = self._responses.get(request_key(method, api, None))
+        if not rls:
+            raise ClientError(f'No captured response for {method} {api}')
+        row = rls[0]
+        if len(rls) > 1:
+            # replay in captured order, the last response keeps being served
+            rls.popleft()
+        if self.speed:
+            await asyncio.sleep(row.get('elapsed', 0) / self.speed)
+        if row.get('error'):
+            raise ClientError(row['error'])
+        return (row.get('body') or '').encode()
@@ -0,0 +1,91 @@
+"""Config flow for Petkit."""
+import logging
+import voluptuous as vol
+
+from homeassistant import config_entries
+from homeassistant.const import CONF_USERNAME, CONF_PASSWORD, CONF_SCAN_INTERVAL, CONF_TOKEN
+from homeassistant.core import callback
+import homeassistant.helpers.config_validation as cv
+
+from .const import (
+    DOMAIN,
+    CONF_API_BASE,
+    CONF_USER_ID,
+    CONF_FEEDING_AMOUNT,
+    DEFAULT_API_BASE,
+    SCAN_INTERVAL,
+    MIN_SCAN_INTERVAL,
+)
+from .api import PetkitAccount
+
+_LOGGER = logging.getLogger(__name__)
+
+FEEDING_AMOUNT_SCHEMA = vol.Any(
+    vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.All(cv.entity_id, cv.entity_domain('input_number')),
+)
+
+
+class PetkitConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
+    VERSION = 1
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(entry: config_entries.ConfigEntry):
+        return PetkitOptionsFlow(entry)
+
+    async def async_step_user(self, user_input=None):
+        errors = {}
+        if user_input is not None:
+            await self.async_set_unique_id(user_input[CONF_USERNAME])
+            self._abort_if_unique_id_configured()
+            if await self.async_check_login(user_input):
+                return self.async_create_entry(title=user_input[CONF_USERNAME], data=user_input)
+            errors['base'] = 'invalid_auth'
+        user_input = user_input or {}
+        schema = vol.Schema({
+            vol.Required(CONF_USERNAME, default=user_input.get(CONF_USERNAME, '')): str,
+            vol.Required(CONF_PASSWORD, default=user_input.get(CONF_PASSWORD, '')): str,
+            vol.Required(CONF_API_BASE, default=user_input.get(CONF_API_BASE, DEFAULT_API_BASE)): str,
+        })
+        return self.async_show_form(step_id='user', data_schema=schema, errors=errors)
+
+    async def async_step_import(self, user_input):
+        """Import an account from configuration.yaml, keeping it in sync on restart."""
+        # token only accounts have no username
+        uid = user_input.get(CONF_USERNAME) or user_input.get(CONF_USER_ID) or user_input.get(CONF_TOKEN)
+        await self.async_set_unique_id(f'{uid}')
+        self._abort_if_unique_id_configured(updates=user_input)
+        return self.async_create_entry(title=f'{uid}', data=user_input)
+
+    async def async_check_login(self, cfg: dict):
+        self.hass.data.setdefault(DOMAIN, {}).setdefault('config', {})
+        acc = PetkitAccount(self.hass, {**cfg})
+        try:
+            return await acc.async_login()
+        finally:
+            await acc.async_close()
+
+
+class PetkitOptionsFlow(config_entries.OptionsFlow):
+    def __init__(self, entry: config_entries.ConfigEntry):
+        self.entry = entry
+
+    async def async_step_init(self, user_input=None):
+        errors = {}
+        if user_input is not None:
+            try:
+                # the form field is text, grams or an input_number entity id
+                amt = FEEDING_AMOUNT_SCHEMA(user_input.get(CONF_FEEDING_AMOUNT, 10))
+                return self.async_create_entry(title='', data={**user_input, CONF_FEEDING_AMOUNT: amt})
+            except vol.Invalid:
+                errors[CONF_FEEDING_AMOUNT] = 'invalid_feeding_amount'
+        cfg = {**self.entry.data, **self.entry.options, **(user_input or {})}
+        itv = cfg.get(CONF_SCAN_INTERVAL) or SCAN_INTERVAL.total_seconds()
+        schema = vol.Schema({
+            vol.Optional(CONF_SCAN_INTERVAL, default=int(cv.time_period(itv).total_seconds())): vol.All(
+                vol.Coerce(int), vol.Range(min=int(MIN_SCAN_INTERVAL.total_seconds())),
+            ),
+            vol.Optional(CONF_FEEDING_AMOUNT, default=f'{cfg.get(CONF_FEEDING_AMOUNT, 10)}'): str,
+        })
+        return self.async_show_form(step_id='init', data_schema=schema, errors=errors)
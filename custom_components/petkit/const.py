@@ -0,0 +1,38 @@
+"""Constants for the component."""
+import datetime
+
+DOMAIN = 'petkit'
+SCAN_INTERVAL = datetime.timedelta(minutes=2)
+# the cloud is polled once per interval for every device of an account
+MIN_SCAN_INTERVAL = datetime.timedelta(minutes=1)
+ROSTER_MISSING_LIMIT = 3
+RESPONSE_CACHE_SIZE = 256
+PUSH_SCAN_INTERVAL = datetime.timedelta(minutes=15)
+PROBE_INTERVAL = datetime.timedelta(minutes=10)
+# fraction of a device slot its poll may drift either way
+POLL_JITTER = 0.2
+
+CONF_ACCOUNTS = 'accounts'
+CONF_API_BASE = 'api_base'
+CONF_USER_ID = 'uid'
+CONF_FEEDING_AMOUNT = 'feeding_amount'
+CONF_MAX_REQUESTS = 'max_requests'
+CONF_PUSH_URL = 'push_url'
+CONF_PUSH_INTERVAL = 'push_scan_interval'
+CONF_LOCAL_URL = 'local_url'
+CONF_LOCAL_DEVICES = 'local_devices'
+CONF_FAST_JSON = 'fast_json'
+CONF_CAPTURE = 'capture'
+CONF_REPLAY = 'replay'
+CONF_REPLAY_SPEED = 'replay_speed'
+CONF_MQTT_TOPIC = 'mqtt_topic'
+
+DEFAULT_API_BASE = 'http://api.petkit.cn/6/'
+
+SUPPORTED_DOMAINS = [
+    'sensor',
+    'binary_sensor',
+    'button',
+    'switch',
+    'select',
+]
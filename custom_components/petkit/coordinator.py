@@ -0,0 +1,398 @@
+"""Devices coordinator."""
+import zlib
+import random
+import asyncio
+import logging
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.const import ATTR_ENTITY_ID, CONF_DEVICE_ID, CONF_DEVICES
+from homeassistant.helpers import device_registry as dr, entity_registry as er
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .const import (
+    DOMAIN,
+    CONF_MQTT_TOPIC,
+    POLL_JITTER,
+    ROSTER_MISSING_LIMIT,
+    SUPPORTED_DOMAINS,
+)
+from .api import PetkitAccount
+from .bridge import MqttBridge
+from .devices import FeederDevice, create_device
+from .profiler import CycleProfiler, profile_phase
+
+_LOGGER = logging.getLogger(__name__)
+
+ENTITY_CLASSES = {}
+
+
+def entity_classes():
+    """Platform entity classes, imported on first use as the platforms import this package."""
+    if not ENTITY_CLASSES:
+        from .sensor import PetkitSensorEntity
+        from .binary_sensor import PetkitBinarySensorEntity
+        from .button import PetkitButtonEntity
+        from .switch import PetkitSwitchEntity
+        from .select import PetkitSelectEntity
+        ENTITY_CLASSES.update({
+            'sensor': PetkitSensorEntity,
+            'binary_sensor': PetkitBinarySensorEntity,
+            'button': PetkitButtonEntity,
+            'switch': PetkitSwitchEntity,
+            'select': PetkitSelectEntity,
+        })
+    return ENTITY_CLASSES
+
+
+def find_device(hass: HomeAssistant, device_id=None, entity_id=None):
+    if device_id:
+        for did, dvc in hass.data[DOMAIN][CONF_DEVICES].items():
+            if f'{did}' == f'{device_id}':
+                return dvc
+    if entity_id:
+        for coordinator in hass.data[DOMAIN]['coordinators'].values():
+            for ent in coordinator._subs.values():
+                if ent.entity_id == entity_id:
+                    return ent._device
+    return None
+
+
+async def async_feed_devices(hass: HomeAssistant, targets: list):
+    """Feed many feeders at once, then refresh them in a single pass."""
+    results = {}
+    feeders = {}
+    for tgt in targets:
+        dvc = find_device(hass, tgt.get(CONF_DEVICE_ID), tgt.get(ATTR_ENTITY_ID))
+        key = f'{tgt.get(CONF_DEVICE_ID) or tgt.get(ATTR_ENTITY_ID)}'
+        if not isinstance(dvc, FeederDevice):
+            results[key] = {'success': False, 'error': 'not_found'}
+            continue
+        if dvc.device_id in feeders:
+            # the same feeder by device and entity id, feeding it twice is never intended
+            results[key] = {'success': False, 'error': 'duplicate', 'device_id': dvc.device_id}
+            continue
+        kws = {
+            k: tgt[k]
+            for k in ['amount', 'amount1', 'amount2']
+            if k in tgt
+        }
+        feeders[dvc.device_id] = [key, dvc, kws]
+
+    rls = await asyncio.gather(*[
+        dvc.save_dailyfeed(**kws)
+        for key, dvc, kws in feeders.values()
+    ], return_exceptions=True)
+    fed = []
+    for (key, dvc, kws), rdt in zip(feeders.values(), rls):
+        if isinstance(rdt, Exception):
+            _LOGGER.error('Petkit feeding %s failed: %s', dvc.device_name, rdt)
+            results[key] = {'success': False, 'error': f'{rdt}'}
+            continue
+        results[key] = {
+            'success': not not rdt,
+            'result': rdt or {},
+        }
+        if rdt:
+            fed.append(dvc)
+
+    rls = await asyncio.gather(*[dvc.update_device_detail() for dvc in fed], return_exceptions=True)
+    for dvc, ret in zip(fed, rls):
+        if isinstance(ret, Exception):
+            _LOGGER.warning('Refresh petkit device %s after feeding failed: %s', dvc.device_name, ret)
+        dvc.notify()
+    return results
+
+
+class SharedDevices:
+    """Assigns each physical device one owning coordinator, other accounts sharing it only subscribe."""
+
+    def __init__(self):
+        self._owners = {}
+        self._subscribers = {}
+
+    def claim(self, did, coordinator):
+        subs = self._subscribers.setdefault(did, [])
+        if coordinator not in subs:
+            subs.append(coordinator)
+        if self._owners.get(did) not in subs:
+            self._owners[did] = subs[0]
+        return self._owners[did] is coordinator
+
+    def release(self, did, coordinator):
+        subs = self._subscribers.get(did) or []
+        if coordinator in subs:
+            subs.remove(coordinator)
+        if self._owners.get(did) is coordinator:
+            self._owners.pop(did, None)
+            if subs:
+                self._owners[did] = subs[0]
+        return self._owners.get(did)
+
+    def owner(self, did):
+        return self._owners.get(did)
+
+    def subscribers(self, did):
+        return list(self._subscribers.get(did) or [])
+
+
+class DevicesCoordinator(DataUpdateCoordinator):
+    def __init__(self, account: PetkitAccount):
+        super().__init__(
+            account.hass,
+            _LOGGER,
+            name=f'{DOMAIN}-{account.uid}-{CONF_DEVICES}',
+            update_interval=account.update_interval,
+        )
+        self.account = account
+        self._subs = {}
+        self.add_entities = {}
+        self._missing = {}
+        self._push_pending = set()
+        self._push_task = None
+        self._slots = {}
+        self._scheduled = False
+        # stable per account offset, so accounts do not poll their devices in step
+        self.phase = zlib.crc32(f'{account.username}'.encode()) % 1000 / 1000
+        self.bridge = None
+        if prefix := account.get_config(CONF_MQTT_TOPIC):
+            self.bridge = MqttBridge(self, prefix)
+        if account.push:
+            account.push.add_event_listener(self._push_event)
+            account.push.add_status_listener(self._push_status)
+
+    @callback
+    def _push_status(self, connected):
+        """Poll slowly as a safety net while push is up, fall back to normal polling when it drops."""
+        if connected:
+            self.update_interval = self.account.push_interval
+        else:
+            self.update_interval = self.account.update_interval
+            self.hass.async_create_task(self.async_request_refresh())
+
+    @callback
+    def _push_event(self, did, evt):
+        dvc = self.hass.data[DOMAIN][CONF_DEVICES].get(did)
+        if dvc is None:
+            dvc = find_device(self.hass, did)
+        if not dvc or dvc.coordinator is not self:
+            return
+        _LOGGER.debug('Petkit push event: %s', evt)
+        self._push_pending.add(dvc)
+        if not self._push_task:
+            self._push_task = self.hass.async_create_task(self._async_push_refresh())
+
+    async def _async_push_refresh(self):
+        await asyncio.sleep(1)
+        dls = list(self._push_pending)
+        self._push_pending.clear()
+        self._push_task = None
+        await asyncio.gather(*[dvc.update_device_detail() for dvc in dls])
+        for dvc in dls:
+            dvc.notify()
+
+    @property
+    def registry(self) -> SharedDevices:
+        return self.hass.data[DOMAIN]['registry']
+
+    @property
+    def devices(self):
+        return {
+            did: dvc
+            for did, dvc in self.hass.data[DOMAIN][CONF_DEVICES].items()
+            if dvc.coordinator is self
+        }
+
+    async def async_profile(self, runs=1, dump=False):
+        """Refresh runs times with per-phase timings, including the entity writes that follow each refresh."""
+        prf = self.account.profiler = CycleProfiler(self.account, runs, dump)
+        try:
+            while prf.runs > 0:
+                prf.start()
+                await self.async_refresh()
+                # let the coalesced device listeners render
+                await asyncio.sleep(0)
+                await prf.async_stop()
+        finally:
+            if prf.active:
+                await prf.async_stop()
+            self.account.profiler = None
+        return prf.results
+
+    def slot_delay(self, idx: int, count: int):
+        """Seconds into the interval at which the idx-th device of this account is polled."""
+        itv = self.update_interval.total_seconds()
+        wid = itv / max(count, 1)
+        pos = (self.phase * itv + idx * wid + random.uniform(-POLL_JITTER, POLL_JITTER) * wid) % itv
+        return max(pos, 0)
+
+    async def _handle_refresh_interval(self, _now=None):
+        # only interval cycles defer details to slots, requested refreshes fetch them at once
+        self._scheduled = True
+        try:
+            await super()._handle_refresh_interval(_now)
+        finally:
+            self._scheduled = False
+
+    def schedule_slot(self, dvc, delay: float):
+        if dvc.device_id in self._slots:
+            # a pending slot is kept, pushing it back on every refresh could starve the device
+            return
+        self._slots[dvc.device_id] = self.hass.loop.call_later(
+            delay, lambda: self.hass.async_create_task(self._async_poll_slot(dvc)),
+        )
+
+    def cancel_slot(self, did):
+        if old := self._slots.pop(did, None):
+            old.cancel()
+
+    async def _async_poll_slot(self, dvc):
+        self._slots.pop(dvc.device_id, None)
+        if dvc.coordinator is not self:
+            return
+        await dvc.update_device_detail(poll=True)
+        if dvc.detail_changed:
+            dvc.notify()
+
+    async def _async_update_data(self):
+        with profile_phase(self.account, 'roster'):
+            dls = await self.account.get_devices()
+        seen = set()
+        # after the first cycle details are fetched in slots spread over the interval
+        stagger = self._scheduled and self.data is not None and not self.account.profiler
+        owned = []
+        for dvc in dls:
+            # the roster is a shared decoded response, it is copied rather than written to
+            dat = {**(dvc.get('data') or {}), 'type': dvc.get('type') or ''}
+            did = dat.get('id')
+            if not did:
+                continue
+            seen.add(did)
+            if not self.registry.claim(did, self):
+                # shared device, refreshed by the owning account
+                continue
+            old = self.hass.data[DOMAIN][CONF_DEVICES].get(did)
+            if old:
+                dvc = old
+                if dvc.coordinator is not self:
+                    await self.adopt_device(dvc)
+                changed = dvc.update_data(dat, notify=False)
+            else:
+                changed = True
+                dvc = create_device(dat, self)
+                self.hass.data[DOMAIN][CONF_DEVICES][did] = dvc
+            if self.bridge:
+                self.bridge.attach(dvc)
+            if stagger and old:
+                owned.append(dvc)
+                if changed:
+                    dvc.notify()
+            else:
+                self.cancel_slot(did)
+                with profile_phase(self.account, f'device.{dvc.device_type}'):
+                    await dvc.update_device_detail(poll=self._scheduled)
+                if changed or dvc.detail_changed:
+                    dvc.notify()
+            with profile_phase(self.account, 'entities.add'):
+                for d in SUPPORTED_DOMAINS:
+                    await self.update_hass_entities(d, dvc)
+        for idx, dvc in enumerate(owned):
+            self.schedule_slot(dvc, self.slot_delay(idx, len(owned)))
+        if dls:
+            # an empty roster is indistinguishable from a failed request, never prune on it
+            self.reconcile_devices(seen)
+        return self.devices
+
+    def reconcile_devices(self, seen: set):
+        """Retire devices missing from the roster for several consecutive cycles."""
+        known = set(self.devices)
+        known.update(self._missing)
+        for did in known:
+            if did in seen:
+                self._missing.pop(did, None)
+                continue
+            self._missing[did] = self._missing.get(did, 0) + 1
+            if self._missing[did] < ROSTER_MISSING_LIMIT:
+                continue
+            self._missing.pop(did, None)
+            self.retire_device(did)
+        for did in list(self.hass.data[DOMAIN][CONF_DEVICES]):
+            if did not in seen and self in self.registry.subscribers(did) and did not in self.devices:
+                self.registry.release(did, self)
+
+    def unload_devices(self):
+        """Release every device of this account, entities are removed by unloading the platforms."""
+        self._subs.clear()
+        self.add_entities.clear()
+        for did in list(self._slots):
+            self.cancel_slot(did)
+        for did in list(self.hass.data[DOMAIN][CONF_DEVICES]):
+            if self not in self.registry.subscribers(did):
+                continue
+            dvc = self.hass.data[DOMAIN][CONF_DEVICES][did]
+            if self.bridge:
+                self.bridge.detach(dvc)
+            if self.registry.release(did, self):
+                # still listed by another account, which adopts it on its next cycle
+                if dvc.coordinator is self:
+                    dvc.detach()
+                continue
+            self.hass.data[DOMAIN][CONF_DEVICES].pop(did)
+            dvc.shutdown()
+
+    def retire_device(self, did):
+        self.cancel_slot(did)
+        dvc = self.hass.data[DOMAIN][CONF_DEVICES].get(did)
+        if self.bridge and dvc:
+            self.bridge.detach(dvc)
+        if self.registry.release(did, self):
+            # still listed by another account, which adopts it on its next cycle
+            return
+        dvc = self.hass.data[DOMAIN][CONF_DEVICES].pop(did, None)
+        if not dvc:
+            return
+        _LOGGER.info('Petkit device %s removed from roster of %s', dvc.device_name, self.account.username)
+        reg = er.async_get(self.hass)
+        sfx = f'.{did}'
+        for key in [k for k in self._subs if k.endswith(sfx)]:
+            ent = self._subs.pop(key)
+            if ent.registry_entry:
+                reg.async_remove(ent.entity_id)
+            else:
+                self.hass.async_create_task(ent.async_remove(force_remove=True))
+        dev_reg = dr.async_get(self.hass)
+        dev = dev_reg.async_get_device(identifiers={(DOMAIN, f'{dvc.device_type}_{did}')})
+        if dev and self.config_entry:
+            # the device is deleted with its last config entry
+            dev_reg.async_update_device(dev.id, remove_config_entry_id=self.config_entry.entry_id)
+        dvc.shutdown()
+
+    async def adopt_device(self, dvc):
+        """Take over a shared device whose owning account no longer polls it."""
+        old = dvc.coordinator
+        if old and old.bridge:
+            old.bridge.detach(dvc)
+        sfx = f'.{dvc.device_id}'
+        # a device released by an unloaded account has no owner, its entities are gone already
+        for key in [k for k in (old._subs if old else {}) if k.endswith(sfx)]:
+            ent = old._subs.pop(key)
+            # entities are bound to the coordinator and session of the old account,
+            # they are recreated with the same unique ids under this one
+            if ent.hass:
+                await ent.async_remove(force_remove=True)
+        dvc.coordinator = self
+        dvc.account = self.account
+
+    async def update_hass_entities(self, domain, dvc):
+        hdk = f'hass_{domain}'
+        add = self.add_entities.get(domain)
+        cls = entity_classes().get(domain)
+        if not add or not cls or not hasattr(dvc, hdk):
+            return
+        for k, cfg in getattr(dvc, hdk).items():
+            key = f'{domain}.{k}.{dvc.device_id}'
+            if key in self._subs:
+                continue
+            new = cls(k, dvc, cfg)
+            new.sub_key = key
+            self._subs[key] = new
+            add([new])
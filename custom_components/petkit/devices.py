@@ -0,0 +1,1272 @@
+"""Petkit device models."""
+import copy
+import time
+import asyncio
+import logging
+import datetime
+import functools
+
+from typing import TYPE_CHECKING
+
+from homeassistant.core import callback
+from homeassistant.const import CONF_DEVICES, PERCENTAGE, UnitOfMass
+from homeassistant.helpers.event import async_track_point_in_time, async_track_state_change_event
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, CONF_FEEDING_AMOUNT
+from .profiler import profile_phase
+from .stats import DepletionModel, HourlySeries, SampleSeries
+
+if TYPE_CHECKING:
+    from .coordinator import DevicesCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+# feeders log a planned feeding a little after it happens
+FEED_REFRESH_DELAY = datetime.timedelta(seconds=90)
+FEEDER_BASELINE_INTERVAL = datetime.timedelta(minutes=30)
+
+
+def local_day():
+    """Today in the timezone of Home Assistant, day params and the midnight refresh follow it."""
+    return dt_util.now().strftime('%Y%m%d')
+
+
+class CircuitBreaker:
+    """Negative cache for a failing call, probed again on an exponential backoff."""
+
+    def __init__(self, threshold=3, base=300, limit=3600):
+        self.threshold = threshold
+        self.base = base
+        self.limit = limit
+        self.failures = 0
+        self.retry_at = 0
+
+    @property
+    def allowed(self):
+        return time.monotonic() >= self.retry_at
+
+    def success(self):
+        self.failures = 0
+        self.retry_at = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            dly = min(self.base * 2 ** (self.failures - self.threshold), self.limit)
+            self.retry_at = time.monotonic() + dly
+
+
+class DeviceState:
+    """Typed fields parsed once per refresh from the raw roster data and detail."""
+    __slots__ = (
+        'state',
+        'status',
+        'battery',
+        'feed_state',
+        'feed_times',
+        'feed_amount',
+        'eat_amount',
+        'eat_times',
+        'work_mode',
+        'manual_lock',
+        'filter_level',
+        'filter_days',
+        'records',
+    )
+
+    def __init__(self):
+        self.state = None
+        self.status = {}
+        self.battery = None
+        self.feed_state = {}
+        self.feed_times = 0
+        self.feed_amount = 0
+        self.eat_amount = 0
+        self.eat_times = 0
+        self.work_mode = 0
+        self.manual_lock = False
+        self.filter_level = None
+        self.filter_days = None
+        self.records = []
+
+    @classmethod
+    def parse(cls, typ: str, data: dict, detail: dict):
+        obj = cls()
+        obj.state = data.get('state')
+        obj.status = data.get('status') or {}
+        obj.battery = data.get('battery')
+        obj.filter_level = data.get('filterPercent')
+        obj.filter_days = data.get('filterExpectedDays')
+        obj.work_mode = (obj.status.get('workState') or {}).get('workMode', 0)
+
+        obj.feed_state = (detail.get('state') or {}).get('feedState') or {}
+        fas = obj.feed_state
+        if typ == 'd3':
+            obj.feed_times = len(fas.get('feedTimes', []))
+        else:
+            obj.feed_times = fas.get('times', 0)
+        if typ == 'd4s':
+            obj.feed_amount = fas.get('realAmountTotal1', 0) + fas.get('realAmountTotal2', 0)
+        else:
+            obj.feed_amount = fas.get('realAmountTotal', 0)
+        obj.eat_amount = fas.get('eatAmountTotal', 0)
+        obj.eat_times = len(fas.get('eatTimes', []))
+
+        obj.manual_lock = True if (detail.get('settings') or {}).get('manualLock') else False
+        obj.records = detail.get('records') or []
+        return obj
+
+
+class PetkitDevice:
+    data: dict
+
+    def __init__(self, dat: dict, coordinator: 'DevicesCoordinator'):
+        self.coordinator = coordinator
+        self.account = coordinator.account
+        self.listeners = {}
+        self.consumers = {}
+        self.generation = 0
+        self._notify_handle = None
+        self.detail = {}
+        self.parsed = DeviceState()
+        self.breakers = {}
+        self.detail_changed = False
+        self._results = {}
+        self.offline_breaker = CircuitBreaker(threshold=1)
+        self.depletion = {}
+        self._depletion_store = None
+        self.update_data(dat)
+
+    def update_data(self, dat: dict, notify=True):
+        if getattr(self, 'data', None) == dat:
+            self.data = dat
+            return False
+        self.data = dat
+        self.parse()
+        if notify:
+            self.notify()
+        _LOGGER.info('Update petkit device data: %s', dat)
+        return True
+
+    def update_detail(self, rdt: dict):
+        self.detail = rdt
+        self.parse()
+
+    def parse(self):
+        try:
+            self.parsed = DeviceState.parse(self.device_type, self.data, self.detail)
+        except (AttributeError, TypeError, ValueError) as exc:
+            _LOGGER.warning('Parse petkit device %s failed: %s', self.device_name, exc)
+
+    @property
+    def consumables(self):
+        """Levels that drain between refills, each one gets an empty at forecast."""
+        return {}
+
+    def update_depletion(self):
+        now = time.time()
+        changed = False
+        for name, val in self.consumables.items():
+            if not isinstance(val, (int, float)) or isinstance(val, bool):
+                continue
+            mdl = self.depletion.get(name)
+            if mdl is None:
+                mdl = self.depletion[name] = DepletionModel()
+            changed = mdl.add(now, val) or changed
+        if changed and self._depletion_store:
+            self._depletion_store.async_delay_save(self._depletion_data, 60)
+
+    def _depletion_data(self):
+        return {
+            name: mdl.as_dict()
+            for name, mdl in self.depletion.items()
+        }
+
+    async def async_load_depletion(self):
+        self._depletion_store = Store(self.account.hass, 1, f'{DOMAIN}/depletion-{self.device_id}.json')
+        dat = await self._depletion_store.async_load() or {}
+        for name, mdl in dat.items():
+            self.depletion[name] = DepletionModel.from_dict(mdl)
+        # the levels seen before loading are replayed against the persisted models
+        self.update_depletion()
+
+    def empty_at(self, name):
+        mdl = self.depletion.get(name)
+        if not mdl or mdl.empty_at is None:
+            return None
+        return dt_util.utc_from_timestamp(mdl.empty_at).isoformat()
+
+    def empty_at_attrs(self, name):
+        mdl = self.depletion.get(name)
+        if not mdl:
+            return {}
+        return {
+            'level': mdl.level,
+            'rate_per_day': None if mdl.rate is None else round(mdl.rate, 3),
+        }
+
+    def notify(self):
+        """Signal that the device changed, listeners run once per loop iteration however often this is called."""
+        self.generation += 1
+        if self._notify_handle:
+            return
+        self._notify_handle = self.account.hass.loop.call_soon(self._handle_listeners)
+
+    def _handle_listeners(self):
+        self._notify_handle = None
+        # one depletion sample per batch of changes, however many parses led to it
+        self.update_depletion()
+        for fun in list(self.listeners.values()):
+            fun()
+
+    def detach(self):
+        """Drop the owning account on release, the device waits to be adopted by another one."""
+        self.coordinator = None
+
+    def shutdown(self):
+        if self._notify_handle:
+            self._notify_handle.cancel()
+            self._notify_handle = None
+        self.listeners.clear()
+        self.consumers.clear()
+
+    @property
+    def device_id(self):
+        return self.data.get('id')
+
+    @property
+    def device_type(self):
+        return self.data.get('type', '').lower()
+
+    @property
+    def device_name(self):
+        return self.data.get('name', '')
+
+    @property
+    def status(self):
+        return self.parsed.status
+
+    @property
+    def state(self):
+        sta = self.parsed.state or 0
+        dic = {
+            '1': 'online',
+            '2': 'offline',
+            '3': 'feeding',
+            '4': 'mate_ota',
+            '5': 'device_error',
+            '6': 'battery_mode',
+        }
+        return dic.get(f'{sta}'.strip(), sta)
+
+    def state_attrs(self):
+        return {
+            'state': self.data.get('state'),
+            'desc':  self.data.get('desc'),
+            'status': self.status,
+            'shared': self.data.get('deviceShared'),
+        }
+
+    @property
+    def battery(self):
+        return self.parsed.battery
+
+    @property
+    def hass_sensor(self):
+        dat = {
+            'state': {
+                'icon': 'mdi:information',
+                'state_attrs': self.state_attrs,
+            },
+        }
+        if 'battery' in self.data:
+            dat.update({
+                'battery': {
+                    'class': 'battery',
+                },
+            })
+        for name in self.depletion:
+            dat[f'{name}_empty_at'] = {
+                'class': 'timestamp',
+                'icon': 'mdi:calendar-alert',
+                'state': functools.partial(self.empty_at, name),
+                'state_attrs': functools.partial(self.empty_at_attrs, name),
+            }
+        return dat
+
+    @property
+    def hass_binary_sensor(self):
+        return {}
+
+    @property
+    def hass_button(self):
+        return {}
+
+    @property
+    def hass_switch(self):
+        return {}
+
+    @property
+    def hass_select(self):
+        return {}
+
+    async def request(self, api, pms=None, method='GET', **kwargs):
+        return await self.account.request(api, pms, method, device=self.device_id, **kwargs)
+
+    @property
+    def detail_endpoints(self):
+        """Endpoints fetched concurrently per refresh, `detail` is merged into the root of detail."""
+        return {
+            'detail': {
+                'api': f'{self.device_type}/device_detail',
+                'params': {
+                    'id': self.device_id,
+                },
+            },
+        }
+
+    @property
+    def offline(self):
+        return f'{self.parsed.state}' == '2'
+
+    async def update_device_detail(self, poll=False):
+        """Fetch detail endpoints.
+
+        Scheduled polls skip offline devices and failing endpoints until their backoff expires.
+        """
+        self.detail_changed = False
+        if self._depletion_store is None:
+            await self.async_load_depletion()
+        if poll and self.offline:
+            if not self.offline_breaker.allowed:
+                _LOGGER.debug('Skip petkit device detail for offline %s', self.device_name)
+                return self.detail
+            self.offline_breaker.failure()
+        else:
+            self.offline_breaker.success()
+        all_eps = self.detail_endpoints
+        eps = {
+            k: ep
+            for k, ep in all_eps.items()
+            if self.endpoint_wanted(k, ep)
+        }
+        rls = await asyncio.gather(*[
+            self.fetch_endpoint(k, ep, poll)
+            for k, ep in eps.items()
+        ])
+        if set(eps) == set(self._results) and all(
+            ret is None or ret is self._results[k]
+            for k, ret in zip(eps, rls)
+        ):
+            # byte-identical responses come back as the same parsed objects
+            return self.detail
+        self._results = {
+            k: self._results.get(k) if ret is None else ret
+            for k, ret in zip(eps, rls)
+        }
+        self.detail_changed = True
+        rdt = {}
+        for k, ret in zip(eps, rls):
+            if ret is None:
+                ret = self.detail if k == 'detail' else self.detail.get(k)
+            if k == 'detail':
+                rdt.update({
+                    kk: vv
+                    for kk, vv in (ret if isinstance(ret, dict) else {}).items()
+                    if kk not in all_eps
+                })
+            else:
+                rdt[k] = ret
+        self.update_detail(rdt)
+        return rdt
+
+    async def refresh_detail(self):
+        """Fetch the detail after a control, the next poll sees the same body and would not re-render."""
+        await self.update_device_detail()
+        if self.detail_changed:
+            self.notify()
+
+    def endpoint_wanted(self, key, endpoint: dict):
+        """Optional endpoints are only fetched while an enabled entity consumes them."""
+        if not endpoint.get('optional') or not self.consumers:
+            return True
+        return any(key in eps for eps in self.consumers.values())
+
+    async def fetch_endpoint(self, key, endpoint: dict, poll=False):
+        brk = self.breakers.setdefault(key, CircuitBreaker())
+        if poll and not brk.allowed:
+            _LOGGER.debug('Skip petkit device %s for %s, failed %s times', key, self.device_name, brk.failures)
+            return None
+        rsp = None
+        try:
+            with profile_phase(self.account, f'endpoint.{key}'):
+                rsp = await self.request(
+                    endpoint['api'], endpoint.get('params'), endpoint.get('method', 'GET'), idempotent=True,
+                )
+            rdt = rsp.get('result')
+            if not rdt and not isinstance(rdt, (dict, list)):
+                rdt = {}
+        except (TypeError, ValueError, AttributeError) as exc:
+            rdt = {}
+            _LOGGER.error('Got petkit device %s for %s failed: %s', key, self.device_name, exc)
+        if isinstance(rsp, dict) and 'result' in rsp:
+            brk.success()
+        else:
+            brk.failure()
+        if not rdt:
+            _LOGGER.warning('Got petkit device %s for %s failed: %s', key, self.device_name, rsp)
+        return rdt
+
+
+class FeederDevice(PetkitDevice):
+    def __init__(self, dat: dict, coordinator: 'DevicesCoordinator'):
+        self._feeding_amounts = {}
+        self._feeding_unsubs = {}
+        self.feeding_plan = None
+        self._plan_marker = None
+        self._plan_unsub = None
+        self._detail_fetched = 0
+        super().__init__(dat, coordinator)
+
+    @property
+    def desiccant(self):
+        return self.status.get('desiccantLeftDays') or 0
+
+    @property
+    def consumables(self):
+        if 'desiccantLeftDays' not in self.status:
+            return {}
+        return {
+            'desiccant': self.desiccant,
+        }
+
+    @property
+    def food_state(self):
+        return self.status.get('food', 0) == 0
+
+    def food_state_attrs(self):
+        return {
+            'state': self.status.get('food'),
+            'desc': 'normal' if not self.food_state else 'few',
+        }
+
+    @property
+    def feed_times(self):
+        return self.parsed.feed_times
+
+    @property
+    def feed_amount(self):
+        return self.parsed.feed_amount
+
+    def feed_state_attrs(self):
+        return self.parsed.feed_state
+
+    @property
+    def eat_amount(self):
+        return self.parsed.eat_amount
+
+    @property
+    def eat_times(self):
+        return self.parsed.eat_times
+
+    @property
+    def bowl_weight(self):
+        return self.status.get('weight', 0)
+
+    @property
+    def feeding(self):
+        return False
+
+    @property
+    def feeding_amount(self):
+        return self.get_feeding_amount()
+
+    def get_feeding_amount(self, index=''):
+        if index not in self._feeding_amounts:
+            self.resolve_feeding_amount(index)
+        return self._feeding_amounts[index]
+
+    def resolve_feeding_amount(self, index=''):
+        """Resolve the feeding amount source once, track input_number changes into the cache."""
+        num = self.account.get_config(f'{CONF_FEEDING_AMOUNT}{index}')
+        eid = f'{num}'
+        if 'input_number.' in eid:
+            hass = self.account.hass
+            if index not in self._feeding_unsubs:
+                self._feeding_unsubs[index] = async_track_state_change_event(
+                    hass, [eid], functools.partial(self._feeding_amount_changed, index),
+                )
+            sta = hass.states.get(eid)
+            if sta:
+                num = sta.state
+        self._feeding_amounts[index] = self.parse_feeding_amount(num)
+        return self._feeding_amounts[index]
+
+    @callback
+    def _feeding_amount_changed(self, index, event):
+        sta = event.data.get('new_state')
+        num = self.parse_feeding_amount(sta.state if sta else None)
+        if self._feeding_amounts.get(index) == num:
+            return
+        self._feeding_amounts[index] = num
+        # the feeding switch shows the amount, it is not re-rendered unless the device changes
+        self.notify()
+
+    def detach(self):
+        super().detach()
+        self.stop_timers()
+        # amounts are configured per account, the plan is fetched and scheduled again by the new owner
+        self._feeding_amounts.clear()
+        self._plan_marker = None
+
+    def shutdown(self):
+        super().shutdown()
+        self.stop_timers()
+
+    def stop_timers(self):
+        for unsub in self._feeding_unsubs.values():
+            unsub()
+        self._feeding_unsubs.clear()
+        if self._plan_unsub:
+            self._plan_unsub()
+            self._plan_unsub = None
+
+    @property
+    def plan_api(self):
+        typ = self.device_type
+        if typ == 'feedermini':
+            return 'feedermini/dailyfeeds'
+        if typ in ['d3', 'd4', 'd4s']:
+            return f'{typ}/dailyFeeds'
+        return 'feeder/dailyfeeds'
+
+    async def update_device_detail(self, poll=False):
+        """Between planned feedings and midnight, scheduled polls only refresh at a low baseline."""
+        age = time.monotonic() - self._detail_fetched
+        if poll and self._plan_unsub and age < FEEDER_BASELINE_INTERVAL.total_seconds():
+            self.detail_changed = False
+            return self.detail
+        rdt = await super().update_device_detail(poll)
+        self._detail_fetched = time.monotonic()
+        day = local_day()
+        mkr = repr([self.detail.get('feed'), self.detail.get('settings')])
+        if not self.feeding_plan or self.feeding_plan['day'] != day or mkr != self._plan_marker:
+            await self.update_feeding_plan(day, mkr)
+        return rdt
+
+    async def update_feeding_plan(self, day, marker=None):
+        brk = self.breakers.setdefault('plan', CircuitBreaker())
+        if not brk.allowed:
+            return
+        rsp = None
+        try:
+            rsp = await self.request(self.plan_api, {
+                'deviceId': self.device_id,
+                'days': day,
+            }, idempotent=True)
+        except (TypeError, ValueError, AttributeError) as exc:
+            _LOGGER.error('Got petkit feeding plan for %s failed: %s', self.device_name, exc)
+        rdt = rsp.get('result') if isinstance(rsp, dict) else None
+        if rdt is None:
+            _LOGGER.warning('Got petkit feeding plan for %s failed: %s', self.device_name, rsp)
+            brk.failure()
+            return
+        brk.success()
+        self._plan_marker = marker
+        self.feeding_plan = {
+            'day': day,
+            'times': self.parse_feeding_times(rdt),
+        }
+        _LOGGER.debug('Petkit feeding plan for %s: %s', self.device_name, self.feeding_plan)
+        self.schedule_plan_refresh()
+
+    @staticmethod
+    def parse_feeding_times(rdt):
+        """Seconds after local midnight of each planned feeding, from the nested day/items lists."""
+        tms = set()
+        rls = list(rdt) if isinstance(rdt, list) else [rdt]
+        while rls:
+            itm = rls.pop()
+            if isinstance(itm, list):
+                rls.extend(itm)
+            elif isinstance(itm, dict):
+                if 'items' in itm or 'feed' in itm:
+                    rls.append(itm.get('items') or itm.get('feed') or [])
+                elif isinstance(itm.get('time'), int) and 0 <= itm['time'] < 86400:
+                    tms.add(itm['time'])
+        return sorted(tms)
+
+    def schedule_plan_refresh(self):
+        """Wake up just after the next planned feeding, or after midnight when the counters roll over."""
+        if self._plan_unsub:
+            self._plan_unsub()
+            self._plan_unsub = None
+        now = dt_util.now()
+        mid = dt_util.start_of_local_day(now)
+        pts = [
+            mid + datetime.timedelta(seconds=sec) + FEED_REFRESH_DELAY
+            for sec in (self.feeding_plan or {}).get('times') or []
+        ]
+        pts.append(mid + datetime.timedelta(days=1) + FEED_REFRESH_DELAY)
+        nxt = min(pt for pt in pts if pt > now)
+        self._plan_unsub = async_track_point_in_time(self.account.hass, self._async_plan_refresh, nxt)
+
+    async def _async_plan_refresh(self, now=None):
+        self._plan_unsub = None
+        try:
+            await self.update_device_detail()
+            self.notify()
+        finally:
+            # a retired device is no longer in the registry of devices, a released one has no owner
+            dvc = self.account.hass.data[DOMAIN][CONF_DEVICES].get(self.device_id)
+            if not self._plan_unsub and self.coordinator and dvc is self:
+                self.schedule_plan_refresh()
+
+    def parse_feeding_amount(self, num):
+        try:
+            num = int(float(num))
+        except (TypeError, ValueError):
+            num = 10
+            if self.device_type in ['d4s']:
+                num = 1
+        return num
+
+    def feeding_attrs(self):
+        ext = {}
+        if self.device_type in ['d4s']:
+            ext.update({
+                'feeding_amount1': self.get_feeding_amount('1'),
+                'feeding_amount2': self.get_feeding_amount('2'),
+            })
+        return {
+            'feeding_amount': self.feeding_amount,
+            'desc': self.data.get('desc'),
+            'error': self.status.get('errorMsg'),
+            **ext,
+            **self.feed_state_attrs(),
+        }
+
+    @property
+    def hass_sensor(self):
+        dat = {
+                **super().hass_sensor,
+                'desiccant': {
+                    'unit': 'days',
+                    'icon': 'mdi:air-filter',
+                },
+                'feed_times': {
+                    'unit': 'times',
+                    'icon': 'mdi:counter',
+                    'state_attrs': self.feed_state_attrs,
+                },
+                'feed_amount': {
+                    'unit': UnitOfMass.GRAMS,
+                    'icon': 'mdi:weight-gram',
+                    'state_attrs': self.feed_state_attrs,
+                },
+            }
+        if self.device_type == 'd3':
+            dat.update({
+                'eat_amount': {
+                    'unit': UnitOfMass.GRAMS,
+                    'icon': 'mdi:weight-gram',
+                },
+                'eat_times': {
+                    'unit': 'times',
+                    'icon': 'mdi:counter',
+                },
+                'bowl_weight': {
+                    'unit': UnitOfMass.GRAMS,
+                    'icon': 'mdi:weight-gram',
+                },
+            })
+        return dat
+
+    @property
+    def hass_binary_sensor(self):
+        return {
+            **super().hass_binary_sensor,
+            'food_state': {
+                'icon': 'mdi:food-drumstick-outline',
+                'class': 'problem',
+                'state_attrs': self.food_state_attrs,
+            },
+        }
+
+    @property
+    def hass_switch(self):
+        return {
+            **super().hass_switch,
+            'feeding': {
+                'icon': 'mdi:shaker',
+                'state_attrs': self.feeding_attrs,
+                'async_turn_on': self.feeding_now,
+            },
+        }
+
+    async def feeding_now(self, **kwargs):
+        rdt = await self.save_dailyfeed(**kwargs)
+        if not rdt:
+            return False
+        await self.refresh_detail()
+        _LOGGER.info('Petkit feeding now: %s', rdt)
+        return rdt
+
+    async def save_dailyfeed(self, **kwargs):
+        typ = self.device_type
+        api = 'feeder/save_dailyfeed'
+        if typ == 'feedermini':
+            api = 'feedermini/save_dailyfeed'
+        elif typ in ['d3', 'd4', 'd4s']:
+            api = f'{typ}/saveDailyFeed'
+        pms = {
+            'deviceId': self.device_id,
+            'day': local_day(),
+            'time': -1,
+            'amount': kwargs.get('amount', self.feeding_amount),
+        }
+        if typ in ['d4s']:
+            pms.update({
+                'amount1': kwargs.get('amount1', self.get_feeding_amount('1')),
+                'amount2': kwargs.get('amount2', self.get_feeding_amount('2')),
+            })
+        rdt = await self.request(api, pms)
+        eno = rdt.get('error', {}).get('code', 0)
+        if eno:
+            _LOGGER.error('Petkit feeding failed: %s', rdt)
+            return False
+        return rdt
+
+
+class LitterDevice(PetkitDevice):
+    def __init__(self, dat: dict, coordinator: 'DevicesCoordinator'):
+        self.pet_weights = {}
+        self._weights_store = None
+        super().__init__(dat, coordinator)
+
+    @property
+    def power(self):
+        return not not self.status.get('power')
+
+    @property
+    def box_full(self):
+        return self.status.get('boxFull')
+
+    @property
+    def sand_percent(self):
+        return self.status.get('sandPercent')
+
+    @property
+    def consumables(self):
+        return {
+            'sand_percent': self.sand_percent,
+            'liquid': self.liquid,
+        }
+
+    def sand_attrs(self):
+        return {
+            'sand_lack': self.status.get('sandLack'),
+            'sand_weight': self.status.get('sandWeight'),
+        }
+
+    @property
+    def liquid(self):
+        return self.status.get('liquid')
+
+    def liquid_attrs(self):
+        return {
+            'liquid': self.status.get('liquid'),
+            'liquid_empty': self.status.get('liquidEmpty'),
+            'liquid_lack': self.status.get('liquidLack'),
+        }
+
+    @property
+    def work_mode(self):
+        return self.parsed.work_mode
+
+    @property
+    def in_times(self):
+        return self.detail.get('inTimes')
+
+    @property
+    def pet_weight(self):
+        evt = self.pet_weight_attrs()
+        return evt.get('petWeight')
+
+    def pet_weight_attrs(self):
+        return self.last_record_attrs(only_event=10)
+
+    async def async_load_weights(self):
+        self._weights_store = Store(self.account.hass, 1, f'{DOMAIN}/weights-{self.device_id}.json')
+        dat = await self._weights_store.async_load() or {}
+        for pet, ser in dat.items():
+            self.pet_weights[pet] = SampleSeries.from_dict(ser)
+
+    def ingest_weights(self):
+        """Feed new occupied records into the per pet weight series, each one is O(1)."""
+        added = False
+        for rec in self.records:
+            if not isinstance(rec, dict) or rec.get('eventType') != 10:
+                continue
+            ctx = rec.get('content') or {}
+            wgt = ctx.get('petWeight')
+            tim = rec.get('timestamp')
+            if not wgt or not tim:
+                continue
+            pet = f'{ctx.get("petId") or rec.get("petId") or "pet"}'
+            ser = self.pet_weights.get(pet)
+            if ser is None:
+                ser = self.pet_weights[pet] = SampleSeries()
+            added = ser.add(float(tim), wgt) or added
+        if added and self._weights_store:
+            self._weights_store.async_delay_save(self._weights_data, 60)
+
+    def _weights_data(self):
+        return {
+            pet: ser.as_dict()
+            for pet, ser in self.pet_weights.items()
+        }
+
+    def pet_weight_stats(self, pet, days):
+        return self.pet_weights[pet].stats(days, time.time()) if pet in self.pet_weights else {}
+
+    def update_detail(self, rdt: dict):
+        super().update_detail(rdt)
+        self.ingest_weights()
+
+    async def update_device_detail(self, poll=False):
+        if self._weights_store is None:
+            await self.async_load_weights()
+        return await super().update_device_detail(poll)
+
+    @property
+    def records(self):
+        return self.parsed.records
+
+    @property
+    def last_record(self):
+        evt = self.last_record_attrs().get('eventType') or 0
+        dic = {
+            5: 'cleaned',
+            6: 'dumped',
+            7: 'reset',
+            8: 'deodorized',
+            10: 'occupied',
+        }
+        return dic.get(evt, evt)
+
+    def last_record_attrs(self, only_event=None):
+        with profile_phase(self.account, 'last_record_attrs'):
+            rls = copy.deepcopy(self.records)
+        if not rls:
+            return {}
+        lst = rls[-1] or {}
+        if only_event:
+            rls.reverse()
+            for v in rls:
+                if only_event == v.get('eventType') and v.get('content'):
+                    lst = v
+                    break
+        ctx = lst.pop('content', None) or {}
+        return {**lst, **ctx}
+
+    @property
+    def hass_sensor(self):
+        return {
+            **super().hass_sensor,
+            'sand_percent': {
+                'icon': 'mdi:percent-outline',
+                'state_attrs': self.sand_attrs,
+                'unit': PERCENTAGE,
+            },
+            'liquid': {
+                'icon': 'mdi:water-percent',
+                'state_attrs': self.liquid_attrs,
+                'unit': PERCENTAGE,
+            },
+            'pet_weight': {
+                'icon': 'mdi:weight',
+                'state_attrs': self.pet_weight_attrs,
+                'unit': UnitOfMass.GRAMS,
+                'endpoints': ['records'],
+            },
+            'in_times': {
+                'icon': 'mdi:location-enter',
+                'unit': 'times',
+            },
+            'last_record': {
+                'icon': 'mdi:history',
+                'state_attrs': self.last_record_attrs,
+                'endpoints': ['records'],
+            },
+            **self.hass_pet_weight_sensors,
+        }
+
+    @property
+    def hass_pet_weight_sensors(self):
+        dat = {}
+        for pet in self.pet_weights:
+            for days in [7, 30]:
+                fun = functools.partial(self.pet_weight_stats, pet, days)
+                dat[f'pet_weight_{pet}_{days}d'] = {
+                    'icon': 'mdi:scale-balance',
+                    'state': lambda fun=fun: fun().get('mean'),
+                    'state_attrs': fun,
+                    'unit': UnitOfMass.GRAMS,
+                    'endpoints': ['records'],
+                }
+        return dat
+
+    @property
+    def hass_binary_sensor(self):
+        return {
+            **super().hass_binary_sensor,
+            'box_full': {
+                'icon': 'mdi:tray-full',
+                'class': 'problem',
+            },
+        }
+
+    @property
+    def hass_button(self):
+        return {
+            **super().hass_button,
+            'power': {
+                'icon': 'mdi:broom',
+                'async_press': self.press_cleanup,
+            },
+        }
+
+    @property
+    def hass_switch(self):
+        return {
+            **super().hass_switch,
+            'power': {
+                'icon': 'mdi:power',
+                'async_turn_on': self.turn_on,
+                'async_turn_off': self.turn_off,
+            },
+            'manual_lock': {
+                'icon': 'mdi:lock',
+                'async_turn_on': self.manual_lock_on,
+                'async_turn_off': self.manual_lock_off,
+            },
+        }
+
+    @property
+    def hass_select(self):
+        return {
+            **super().hass_select,
+            'action': {
+                'icon': 'mdi:play-box',
+                'options': list(self.actions.keys()),
+                'async_select': self.select_action,
+                'delay_update': 5,
+            },
+        }
+
+    @property
+    def detail_endpoints(self):
+        pms = {
+            'deviceId': self.device_id,
+        }
+        if self.device_type == 't4':
+            pms['date'] = local_day()
+        return {
+            **super().detail_endpoints,
+            'records': {
+                'api': f'{self.device_type}/getDeviceRecord',
+                'params': pms,
+                'optional': True,
+            },
+        }
+
+    async def turn_on(self, **kwargs):
+        return await self.set_power(True)
+
+    async def turn_off(self, **kwargs):
+        return await self.set_power(False)
+
+    async def set_power(self, on=True):
+        val = 1 if on else 0
+        dat = '{"power_action":%s}' % val
+        return await self.control_device(type='power', kv=dat)
+
+    async def press_cleanup(self, **kwargs):
+        return await self.select_action('cleanup')
+
+    async def press_deodorize(self, **kwargs):
+        return await self.select_action('deodorize')
+
+    @property
+    def action(self):
+        return {
+            0: 'cleanup',
+            2: 'deodorize',
+            9: 'maintain',
+        }.get(self.work_mode, None)
+
+    @property
+    def actions(self):
+        return {
+            'cleanup':   ['start', 0],
+            'pause':     ['stop', self.work_mode],
+            'end':       ['end', self.work_mode],
+            'continue':  ['continue', self.work_mode],
+            'deodorize': ['start', 2],
+            'maintain':  ['start', 9],
+        }
+
+    async def select_action(self, action, **kwargs):
+        act, val = self.actions.get(action, [None, 0])
+        if not act:
+            return False
+        dat = '{"%s_action":%s}' % (act, val)
+        return await self.control_device(type=act, kv=dat)
+
+    @property
+    def manual_lock(self):
+        return self.parsed.manual_lock
+
+    async def manual_lock_on(self, **kwargs):
+        return await self.set_manual_lock(True)
+
+    async def manual_lock_off(self, **kwargs):
+        return await self.set_manual_lock(False)
+
+    async def set_manual_lock(self, on=True):
+        val = 1 if on else 0
+        dat = '{"manualLock":%s}' % val
+        return await self.control_device(kv=dat, api='updateSettings')
+
+    async def control_device(self, api='controlDevice', **kwargs):
+        typ = self.device_type
+        api = f'{typ}/{api}'
+        pms = {
+            'id': self.device_id,
+            **kwargs,
+        }
+        rdt = await self.request(api, pms)
+        eno = rdt.get('error', {}).get('code', 0)
+        if eno:
+            _LOGGER.error('Petkit device control failed: %s', [pms, rdt])
+            return False
+        await self.refresh_detail()
+        _LOGGER.info('Petkit device control: %s', [pms, rdt])
+        return rdt
+
+
+class FitDevice(PetkitDevice):
+    METRICS = ('activity', 'calorie', 'sleep')
+
+    def __init__(self, dat: dict, coordinator: 'DevicesCoordinator'):
+        self.history = HourlySeries(self.METRICS)
+        self._history_store = None
+        super().__init__(dat, coordinator)
+
+    @property
+    def state(self):
+        return self.data.get('syncTime')
+
+    def state_attrs(self):
+        return self.data
+
+    @property
+    def activity(self):
+        return self.activity_attrs().get('total')
+
+    def activity_attrs(self):
+        return self.detail.get('activityRecord') or {}
+
+    @property
+    def calorie(self):
+        return self.calorie_attrs().get('total')
+
+    def calorie_attrs(self):
+        return self.detail.get('calorieRecord') or {}
+
+    @property
+    def sleep(self):
+        return self.sleep_attrs().get('total')
+
+    def sleep_attrs(self):
+        return self.detail.get('sleepDetail') or {}
+
+    @staticmethod
+    def today():
+        return dt_util.now().date().toordinal()
+
+    async def async_load_history(self):
+        self._history_store = Store(self.account.hass, 1, f'{DOMAIN}/history-{self.device_id}.json')
+        dat = await self._history_store.async_load() or {}
+        self.history = HourlySeries.from_dict(dat, metrics=self.METRICS)
+
+    def ingest_data24(self):
+        """Copy the hourly rows of today into the compact history, the raw list is not kept around."""
+        day = self.today()
+        changed = False
+        for idx, row in enumerate(self.detail.get('data24') or []):
+            if not isinstance(row, dict):
+                continue
+            hour = row.get('hour', idx)
+            try:
+                changed = self.history.put(day, int(hour), {
+                    k: row.get(k, row.get(f'{k}Total'))
+                    for k in self.METRICS
+                }) or changed
+            except (TypeError, ValueError):
+                continue
+        if changed and self._history_store:
+            self._history_store.async_delay_save(self.history.as_dict, 60)
+
+    def update_detail(self, rdt: dict):
+        super().update_detail(rdt)
+        self.ingest_data24()
+
+    async def update_device_detail(self, poll=False):
+        if self._history_store is None:
+            await self.async_load_history()
+        return await super().update_device_detail(poll)
+
+    @property
+    def activity_peak_hour(self):
+        return self.history.peak(self.today(), 'activity')[0]
+
+    def activity_peak_hour_attrs(self):
+        return {
+            'activity': self.history.peak(self.today(), 'activity')[1],
+        }
+
+    @property
+    def rest_ratio(self):
+        val = self.history.share(self.today(), 'activity', lambda v: v <= 0)
+        return None if val is None else round(val * 100)
+
+    @property
+    def activity_week_delta(self):
+        return self.history.week_delta(self.today(), 'activity')
+
+    @property
+    def calorie_week_delta(self):
+        return self.history.week_delta(self.today(), 'calorie')
+
+    @property
+    def sleep_week_delta(self):
+        return self.history.week_delta(self.today(), 'sleep')
+
+    @property
+    def hass_sensor(self):
+        return {
+            **super().hass_sensor,
+            'state': {
+                'class': 'timestamp',
+                'state_attrs': self.state_attrs,
+            },
+            'activity': {
+                'icon': 'mdi:run',
+                'state_attrs': self.activity_attrs,
+                'endpoints': ['detail'],
+            },
+            'calorie': {
+                'icon': 'mdi:arm-flex',
+                'state_attrs': self.calorie_attrs,
+                'endpoints': ['detail'],
+            },
+            'sleep': {
+                'icon': 'mdi:sleep',
+                'state_attrs': self.sleep_attrs,
+                'endpoints': ['detail'],
+            },
+            'activity_peak_hour': {
+                'icon': 'mdi:clock-star-four-points-outline',
+                'state_attrs': self.activity_peak_hour_attrs,
+                'endpoints': ['detail'],
+            },
+            'rest_ratio': {
+                'icon': 'mdi:sofa',
+                'unit': PERCENTAGE,
+                'endpoints': ['detail'],
+            },
+            'activity_week_delta': {
+                'icon': 'mdi:run',
+                'unit': PERCENTAGE,
+                'endpoints': ['detail'],
+            },
+            'calorie_week_delta': {
+                'icon': 'mdi:arm-flex',
+                'unit': PERCENTAGE,
+                'endpoints': ['detail'],
+            },
+            'sleep_week_delta': {
+                'icon': 'mdi:sleep',
+                'unit': PERCENTAGE,
+                'endpoints': ['detail'],
+            },
+        }
+
+    @property
+    def detail_endpoints(self):
+        return {
+            'detail': {
+                'api': f'{self.device_type}/deviceAllData',
+                'params': {
+                    'deviceId': self.device_id,
+                    'day': local_day(),
+                },
+                'optional': True,
+            },
+        }
+
+
+class W5Device(PetkitDevice):
+    @property
+    def state(self):
+        dat = self.data or {}
+        if dat.get('lackWarning'):
+            return 'water_lack'
+        if dat.get('breakdownWarning'):
+            return 'breakdown'
+        if dat.get('runStatus'):
+            return 'working'
+        if dat.get('powerStatus'):
+            return 'idle'
+        return None
+
+    def state_attrs(self):
+        return self.data
+
+    @property
+    def filter_level(self):
+        return self.parsed.filter_level
+
+    @property
+    def filter_days(self):
+        return self.parsed.filter_days
+
+    @property
+    def consumables(self):
+        return {
+            'filter_level': self.filter_level,
+            'filter_days': self.filter_days,
+        }
+
+    @property
+    def hass_sensor(self):
+        return {
+            **super().hass_sensor,
+            'filter_level': {},
+            'filter_days': {},
+        }
+
+
+def create_device(dat: dict, coordinator: 'DevicesCoordinator'):
+    typ = dat.get('type', '').lower()
+    if typ in ['p3']:
+        return FitDevice(dat, coordinator)
+    if typ in ['t3', 't4']:
+        return LitterDevice(dat, coordinator)
+    if typ in ['w5']:
+        return W5Device(dat, coordinator)
+    return FeederDevice(dat, coordinator)
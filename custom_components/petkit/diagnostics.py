@@ -0,0 +1,24 @@
+"""Diagnostics support for Petkit."""
+from homeassistant.core import HomeAssistant
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_TOKEN
+from homeassistant.components.diagnostics import async_redact_data
+
+from .const import DOMAIN
+
+TO_REDACT = {CONF_PASSWORD, CONF_TOKEN}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry):
+    coordinator = hass.data[DOMAIN]['entries'].get(entry.entry_id)
+    dat = {
+        'config': async_redact_data({**entry.data, **entry.options}, TO_REDACT),
+    }
+    if not coordinator:
+        return dat
+    acc = coordinator.account
+    dat.update({
+        'api_bases': acc.cloud.diagnostics(),
+        'traffic': acc.traffic_stats(),
+    })
+    return dat
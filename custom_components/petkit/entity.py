@@ -0,0 +1,137 @@
+"""Base entities."""
+import copy
+import logging
+
+from homeassistant.core import callback
+from homeassistant.const import STATE_OFF, STATE_ON
+from homeassistant.components import persistent_notification
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .const import DOMAIN
+from .devices import PetkitDevice
+from .profiler import profile_phase
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PetkitEntity(CoordinatorEntity):
+    def __init__(self, name, device: PetkitDevice, option=None):
+        self.coordinator = device.coordinator
+        CoordinatorEntity.__init__(self, self.coordinator)
+        self.account = self.coordinator.account
+        self._name = name
+        self._device = device
+        self._option = option or {}
+        self.sub_key = None
+        self._rendered = None
+        self._rendered_available = None
+        self._attr_name = f'{device.device_name} {name}'.strip()
+        self._attr_device_id = f'{device.device_type}_{device.device_id}'
+        self._attr_unique_id = f'{self._attr_device_id}-{name}'
+        self.entity_id = f'{DOMAIN}.{self._attr_device_id}_{name}'
+        self._attr_icon = self._option.get('icon')
+        self._attr_device_class = self._option.get('class')
+        self._attr_unit_of_measurement = self._option.get('unit')
+        self._attr_device_info = {
+            'identifiers': {(DOMAIN, self._attr_device_id)},
+            'name': device.data.get('name'),
+            'model': device.data.get('type'),
+            'manufacturer': 'Petkit',
+            'sw_version': device.detail.get('firmware'),
+        }
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self._device.listeners[self.unique_id] = self._handle_device_update
+        self._device.consumers[self.unique_id] = self._option.get('endpoints') or []
+        if self.sub_key:
+            self.coordinator._subs[self.sub_key] = self
+        self.render_state()
+
+    async def async_will_remove_from_hass(self):
+        await super().async_will_remove_from_hass()
+        self._device.listeners.pop(self.unique_id, None)
+        self._device.consumers.pop(self.unique_id, None)
+        if self.sub_key and self.coordinator._subs.get(self.sub_key) is self:
+            self.coordinator._subs.pop(self.sub_key, None)
+
+    @property
+    def rendered(self):
+        return self._rendered == self._device.generation and self._rendered_available == self.available
+
+    @callback
+    def _handle_device_update(self):
+        if self.rendered:
+            return
+        self.render_state()
+
+    @callback
+    def _handle_coordinator_update(self):
+        # a successful refresh has already been rendered through the device listener,
+        # a failed one or the recovery from it changes availability only
+        if self.rendered:
+            return
+        self.render_state()
+
+    def render_state(self):
+        self._rendered = self._device.generation
+        self._rendered_available = self.available
+        with profile_phase(self.account, 'entities.write'):
+            self.update()
+            self.async_write_ha_state()
+
+    def update(self):
+        if callable(fun := self._option.get('state')):
+            self._attr_state = fun()
+        elif hasattr(self._device, self._name):
+            self._attr_state = getattr(self._device, self._name)
+            _LOGGER.debug('Petkit entity update: %s', [self.entity_id, self._name, self._attr_state])
+
+        fun = self._option.get('state_attrs')
+        if callable(fun):
+            self._attr_extra_state_attributes = fun()
+
+    @property
+    def state(self):
+        return self._attr_state
+
+    @property
+    def unit_of_measurement(self):
+        return self._attr_unit_of_measurement
+
+    async def async_request_api(self, api=None, params=None, method='GET', **kwargs):
+        throw = kwargs.pop('throw', None)
+        items = kwargs.pop('requests', None)
+        ttl = kwargs.pop('cache_ttl', 0)
+        if items:
+            rls = await self.account.batch_request(items, ttl)
+            return {'responses': rls}
+        if not api:
+            raise HomeAssistantError('Either api or requests is required')
+        rdt = copy.deepcopy(await self.account.request(api, params, method, **kwargs))
+        if throw:
+            persistent_notification.create(
+                self.hass,
+                f'{rdt}',
+                f'Request: {api}',
+                f'{DOMAIN}-request',
+            )
+        return rdt
+
+
+class PetkitBinaryEntity(PetkitEntity):
+    def __init__(self, name, device: PetkitDevice, option=None):
+        super().__init__(name, device, option)
+        self._attr_is_on = False
+
+    def update(self):
+        super().update()
+        if hasattr(self._device, self._name):
+            self._attr_is_on = not not getattr(self._device, self._name)
+        else:
+            self._attr_is_on = False
+
+    @property
+    def state(self):
+        return STATE_ON if self._attr_is_on else STATE_OFF
@@ -0,0 +1,81 @@
+"""On-demand profiling of coordinator cycles."""
+import time
+import cProfile
+import logging
+
+from contextlib import contextmanager
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CycleProfiler:
+    """Collects per-phase wall times of the next runs, phases are inclusive so roster contains auth."""
+
+    def __init__(self, account, runs=1, dump=False):
+        self.account = account
+        self.runs = runs
+        self.dump = dump
+        self.results = []
+        self.files = []
+        self._phases = None
+        self._started = None
+        self._profile = None
+
+    @property
+    def active(self):
+        return self._phases is not None
+
+    def start(self):
+        self._phases = {}
+        self._started = time.perf_counter()
+        if self.dump:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    async def async_stop(self):
+        if not self.active:
+            return
+        if self._profile:
+            self._profile.disable()
+        run = {
+            'total': round(time.perf_counter() - self._started, 4),
+            'phases': {
+                k: {'time': round(v[0], 4), 'count': v[1]}
+                for k, v in sorted(self._phases.items(), key=lambda x: -x[1][0])
+            },
+        }
+        self._phases = None
+        if self._profile:
+            fnm = self.account.hass.config.path(f'petkit-profile-{self.account.uid}-{int(time.time())}.prof')
+            await self.account.hass.async_add_executor_job(self._profile.dump_stats, fnm)
+            run['file'] = fnm
+            self.files.append(fnm)
+            self._profile = None
+        _LOGGER.info('Petkit cycle profile for %s: %s', self.account.username, run)
+        self.results.append(run)
+        self.runs -= 1
+
+    def add(self, name, elapsed: float):
+        if self._phases is None:
+            return
+        tim, cnt = self._phases.get(name, (0.0, 0))
+        self._phases[name] = (tim + elapsed, cnt + 1)
+
+    @contextmanager
+    def phase(self, name):
+        tim = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - tim)
+
+
+@contextmanager
+def profile_phase(account, name):
+    """Time a block when the account is being profiled, a no-op otherwise."""
+    prf = getattr(account, 'profiler', None)
+    if not prf or not prf.active:
+        yield
+        return
+    with prf.phase(name):
+        yield
@@ -0,0 +1,167 @@
+"""Push transports for device events."""
+import json
+import time
+import asyncio
+import logging
+
+from abc import ABC, abstractmethod
+
+from aiohttp import ClientError, ClientTimeout, WSMsgType
+
+from .transport import ACCEPT_ENCODING, read_body
+
+_LOGGER = logging.getLogger(__name__)
+
+RETRY_MIN = 5
+RETRY_MAX = 300
+LONG_POLL_TIMEOUT = 60
+# a poll answered faster than this without events was not held by the server
+LONG_POLL_HOLD = 1
+
+
+class PushTransport(ABC):
+    """Long-lived connection that delivers device events, reconnecting with backoff."""
+
+    def __init__(self, account, url: str):
+        self.account = account
+        self.url = url
+        self.connected = False
+        self._event_listeners = []
+        self._status_listeners = []
+        self._task = None
+
+    def add_event_listener(self, fun):
+        self._event_listeners.append(fun)
+        return lambda: self._event_listeners.remove(fun)
+
+    def add_status_listener(self, fun):
+        self._status_listeners.append(fun)
+        return lambda: self._status_listeners.remove(fun)
+
+    def start(self):
+        if self._task:
+            return
+        self._task = self.account.hass.async_create_background_task(
+            self._run(), f'petkit-push-{self.account.uid}',
+        )
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._set_connected(False)
+
+    async def _run(self):
+        delay = RETRY_MIN
+        while True:
+            try:
+                await self.connect()
+            except asyncio.CancelledError:
+                raise
+            except (ClientError, asyncio.TimeoutError, ValueError) as exc:
+                _LOGGER.warning('Petkit push channel %s failed: %s', self.url, exc)
+            if self.connected:
+                delay = RETRY_MIN
+            self._set_connected(False)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX)
+
+    @abstractmethod
+    async def connect(self):
+        """Deliver events until the connection drops."""
+
+    def _set_connected(self, connected: bool):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        _LOGGER.info('Petkit push channel %s %s', self.url, 'connected' if connected else 'disconnected')
+        for fun in list(self._status_listeners):
+            fun(connected)
+
+    def _dispatch_text(self, txt):
+        # one bad message is skipped, it is no reason to drop the connection
+        try:
+            dat = json.loads(txt) if txt else {}
+        except ValueError as exc:
+            _LOGGER.warning('Petkit push channel %s sent invalid message: %s', self.url, exc)
+            return None, 0
+        return dat, self._dispatch(dat)
+
+    def _dispatch(self, dat):
+        if isinstance(dat, dict) and 'events' in dat:
+            dat = dat['events']
+        if isinstance(dat, dict):
+            dat = [dat]
+        if not isinstance(dat, list):
+            return 0
+        cnt = 0
+        for evt in dat:
+            if not isinstance(evt, dict):
+                continue
+            did = evt.get('deviceId') or evt.get('device_id') or evt.get('id')
+            if not did:
+                continue
+            cnt += 1
+            for fun in list(self._event_listeners):
+                fun(did, evt)
+        return cnt
+
+
+class WebsocketTransport(PushTransport):
+    async def connect(self):
+        async with self.account.http.ws_connect(
+            self.url,
+            headers=self.account.headers,
+            heartbeat=30,
+        ) as ws:
+            self._set_connected(True)
+            async for msg in ws:
+                if msg.type == WSMsgType.TEXT:
+                    self._dispatch_text(msg.data)
+                elif msg.type in [WSMsgType.CLOSED, WSMsgType.ERROR]:
+                    break
+
+
+class LongPollTransport(PushTransport):
+    def __init__(self, account, url: str):
+        super().__init__(account, url)
+        self._cursor = None
+
+    async def connect(self):
+        delay = 0
+        while True:
+            tim = time.monotonic()
+            pms = {'timeout': LONG_POLL_TIMEOUT}
+            if self._cursor is not None:
+                pms['cursor'] = self._cursor
+            rsp = await self.account.http.get(
+                self.url,
+                params=pms,
+                headers={**self.account.headers, 'Accept-Encoding': ACCEPT_ENCODING},
+                timeout=ClientTimeout(total=LONG_POLL_TIMEOUT + 15),
+            )
+            rsp.raise_for_status()
+            raw, body = await read_body(rsp)
+            self.account.record_traffic('push', len(raw), len(body))
+            dat, cnt = self._dispatch_text(body)
+            if isinstance(dat, dict):
+                self._cursor = dat.get('cursor', self._cursor)
+            if cnt or time.monotonic() - tim >= LONG_POLL_HOLD:
+                self._set_connected(True)
+                delay = 0
+                continue
+            # instant empty replies are no push channel, keep polling normally and back off
+            self._set_connected(False)
+            delay = min(max(delay * 2, RETRY_MIN), RETRY_MAX)
+            await asyncio.sleep(delay)
+
+
+def create_push_transport(account, url: str):
+    if url.startswith(('ws:', 'wss:')):
+        return WebsocketTransport(account, url)
+    return LongPollTransport(account, url)
@@ -8,26 +8,18 @@ from homeassistant.components.select import (
     DOMAIN as ENTITY_DOMAIN,
 )
 
-from . import (
-    DOMAIN,
-    PetkitDevice,
-    PetkitEntity,
-    async_setup_accounts,
-)
+from . import async_setup_entities
+from .const import DOMAIN
+from .devices import PetkitDevice
+from .entity import PetkitEntity
 
 _LOGGER = logging.getLogger(__name__)
 
 DATA_KEY = f'{ENTITY_DOMAIN}.{DOMAIN}'
 
 
-async def async_setup_entry(hass, config_entry, async_add_entities):
-    cfg = {**config_entry.data, **config_entry.options}
-    await async_setup_platform(hass, cfg, async_setup_platform, async_add_entities)
-
-
-async def async_setup_platform(hass: HomeAssistant, config, async_add_entities, discovery_info=None):
-    hass.data[DOMAIN]['add_entities'][ENTITY_DOMAIN] = async_add_entities
-    await async_setup_accounts(hass, ENTITY_DOMAIN)
+async def async_setup_entry(hass: HomeAssistant, config_entry, async_add_entities):
+    await async_setup_entities(hass, config_entry, ENTITY_DOMAIN, async_add_entities)
 
 
 class PetkitSelectEntity(PetkitEntity, SelectEntity):
@@ -54,5 +46,5 @@ class PetkitSelectEntity(PetkitEntity, SelectEntity):
             self.async_write_ha_state()
             if dly := self._option.get('delay_update'):
                 await asyncio.sleep(dly)
-                self._handle_coordinator_update()
+                self.render_state()
         return ret
@@ -2,43 +2,44 @@
 import logging
 import voluptuous as vol
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, SupportsResponse
 from homeassistant.helpers import config_validation as cv, entity_platform
 from homeassistant.components.sensor import (
     SensorEntity,
     DOMAIN as ENTITY_DOMAIN,
 )
 
-from . import (
-    DOMAIN,
-    PetkitEntity,
-    async_setup_accounts,
-)
+from . import async_setup_entities
+from .const import DOMAIN
+from .entity import PetkitEntity
 
 _LOGGER = logging.getLogger(__name__)
 
 DATA_KEY = f'{ENTITY_DOMAIN}.{DOMAIN}'
 
-
-async def async_setup_entry(hass, config_entry, async_add_entities):
-    cfg = {**config_entry.data, **config_entry.options}
-    await async_setup_platform(hass, cfg, async_setup_platform, async_add_entities)
+BATCH_ITEM_SCHEMA = vol.Schema({
+    vol.Required('api'): cv.string,
+    vol.Optional('params', default={}): vol.Any(dict, None),
+    vol.Optional('method', default='GET'): cv.string,
+})
 
 
-async def async_setup_platform(hass: HomeAssistant, config, async_add_entities, discovery_info=None):
-    hass.data[DOMAIN]['add_entities'][ENTITY_DOMAIN] = async_add_entities
-    await async_setup_accounts(hass, ENTITY_DOMAIN)
+async def async_setup_entry(hass: HomeAssistant, config_entry, async_add_entities):
+    await async_setup_entities(hass, config_entry, ENTITY_DOMAIN, async_add_entities)
 
     platform = entity_platform.async_get_current_platform()
     platform.async_register_entity_service(
         'request_api',
         {
-            vol.Required('api'): cv.string,
+            vol.Exclusive('api', 'request'): cv.string,
             vol.Optional('params', default={}): vol.Any(dict, None),
             vol.Optional('method', default='GET'): cv.string,
             vol.Optional('throw', default=True): cv.boolean,
+            vol.Exclusive('requests', 'request'): vol.All(cv.ensure_list, [BATCH_ITEM_SCHEMA]),
+            vol.Optional('cache_ttl', default=0): cv.positive_int,
         },
         'async_request_api',
+        supports_response=SupportsResponse.OPTIONAL,
     )
 
 
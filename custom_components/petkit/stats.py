@@ -0,0 +1,300 @@
+"""Incremental rolling statistics over bounded sample buffers."""
+from array import array
+from collections import deque
+
+DAY = 86400
+NAN = float('nan')
+# timestamps are kept in days relative to this origin
+ORIGIN = 1.6e9
+
+
+class RollingWindow:
+    """Time window over a SampleSeries, updated in O(1) amortized per sample."""
+
+    def __init__(self, series: 'SampleSeries', span: float):
+        self.series = series
+        self.span = span
+        self.start = 0
+        self.count = 0
+        # running means and co-moments, raw sums of squares of days since the origin
+        # cancel out for samples minutes apart
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.m_xx = 0.0
+        self.m_xy = 0.0
+        self._mins = deque()
+        self._maxs = deque()
+
+    def push(self, seq: int):
+        x, y = self.series.sample(seq)
+        self.count += 1
+        dx = x - self.mean_x
+        self.mean_x += dx / self.count
+        self.mean_y += (y - self.mean_y) / self.count
+        self.m_xx += dx * (x - self.mean_x)
+        self.m_xy += dx * (y - self.mean_y)
+        while self._mins and self.series.value(self._mins[-1]) >= y:
+            self._mins.pop()
+        self._mins.append(seq)
+        while self._maxs and self.series.value(self._maxs[-1]) <= y:
+            self._maxs.pop()
+        self._maxs.append(seq)
+
+    def drop(self):
+        seq = self.start
+        x, y = self.series.sample(seq)
+        self.count -= 1
+        if self.count:
+            # the push above in reverse, with the means before and after the sample
+            old_x, old_y = self.mean_x, self.mean_y
+            self.mean_x -= (x - old_x) / self.count
+            self.mean_y -= (y - old_y) / self.count
+            self.m_xx -= (x - self.mean_x) * (x - old_x)
+            self.m_xy -= (x - self.mean_x) * (y - old_y)
+        else:
+            self.mean_x = self.mean_y = self.m_xx = self.m_xy = 0.0
+        if self._mins and self._mins[0] == seq:
+            self._mins.popleft()
+        if self._maxs and self._maxs[0] == seq:
+            self._maxs.popleft()
+        self.start += 1
+
+    def expire(self, now: float, before_seq=None):
+        floor = (now - ORIGIN) / DAY - self.span
+        while self.count:
+            if before_seq is not None and self.start < before_seq:
+                self.drop()
+            elif self.series.sample(self.start)[0] < floor:
+                self.drop()
+            else:
+                break
+
+    def stats(self):
+        if not self.count:
+            return {}
+        n = self.count
+        slope = self.m_xy / self.m_xx if n > 1 and self.m_xx > 1e-12 else 0.0
+        return {
+            'mean': round(self.mean_y, 1),
+            'min': self.series.value(self._mins[0]),
+            'max': self.series.value(self._maxs[0]),
+            'slope': round(slope, 2),
+            'count': n,
+        }
+
+
+class SampleSeries:
+    """Fixed-capacity ring buffer of (timestamp, value) samples with rolling windows in days."""
+
+    def __init__(self, capacity=1024, windows=(7, 30)):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.seq = 0
+        self.windows = {
+            days: RollingWindow(self, days)
+            for days in windows
+        }
+
+    def sample(self, seq: int):
+        pos = seq % self.capacity
+        return self.times[pos], self.values[pos]
+
+    def value(self, seq: int):
+        return self.values[seq % self.capacity]
+
+    @property
+    def last_time(self):
+        if not self.seq:
+            return None
+        return self.times[(self.seq - 1) % self.capacity] * DAY + ORIGIN
+
+    def add(self, ts: float, val: float):
+        """Append a sample newer than the last one, returns False for stale or duplicate samples."""
+        last = self.last_time
+        if last is not None and ts <= last:
+            return False
+        if self.seq >= self.capacity:
+            # the oldest sample is about to be overwritten
+            for win in self.windows.values():
+                win.expire(ts, before_seq=self.seq - self.capacity + 1)
+        pos = self.seq % self.capacity
+        self.times[pos] = (ts - ORIGIN) / DAY
+        self.values[pos] = float(val)
+        seq = self.seq
+        self.seq += 1
+        for win in self.windows.values():
+            win.push(seq)
+            win.expire(ts)
+        return True
+
+    def stats(self, days, now=None):
+        win = self.windows.get(days)
+        if not win:
+            return {}
+        if now is not None:
+            win.expire(now)
+        return win.stats()
+
+    def as_dict(self):
+        first = max(0, self.seq - self.capacity)
+        rls = [self.sample(seq) for seq in range(first, self.seq)]
+        return {
+            'times': [round(t * DAY + ORIGIN, 3) for t, v in rls],
+            'values': [v for t, v in rls],
+        }
+
+    @classmethod
+    def from_dict(cls, dat: dict, **kwargs):
+        obj = cls(**kwargs)
+        for ts, val in zip(dat.get('times') or [], dat.get('values') or []):
+            obj.add(ts, val)
+        return obj
+
+
+class HourlySeries:
+    """Hourly values of a few metrics over the last days, one flat array with a slot per day."""
+
+    def __init__(self, metrics, days=14):
+        self.metrics = tuple(metrics)
+        self.days = days
+        self.width = 24 * len(self.metrics)
+        self.values = array('d', [NAN]) * (days * self.width)
+        self.slot_days = array('l', bytes(8 * days))
+
+    def _slot(self, day: int, create=False):
+        slot = day % self.days
+        if self.slot_days[slot] != day:
+            if not create or self.slot_days[slot] > day:
+                # a day older than the one in its slot has already been dropped
+                return None
+            # reuse the slot of the oldest day
+            self.slot_days[slot] = day
+            pos = slot * self.width
+            self.values[pos:pos + self.width] = array('d', [NAN]) * self.width
+        return slot
+
+    def put(self, day: int, hour: int, row: dict):
+        """Store one hour of metrics, returns True when any value changed."""
+        slot = self._slot(day, create=True) if 0 <= hour < 24 else None
+        if slot is None:
+            return False
+        pos = slot * self.width + hour * len(self.metrics)
+        changed = False
+        for idx, key in enumerate(self.metrics):
+            val = row.get(key)
+            if val is None:
+                continue
+            val = float(val)
+            if self.values[pos + idx] != val:
+                self.values[pos + idx] = val
+                changed = True
+        return changed
+
+    def hourly(self, day: int, metric: str):
+        slot = self._slot(day)
+        if slot is None:
+            return []
+        idx = self.metrics.index(metric)
+        pos = slot * self.width + idx
+        return self.values[pos:pos + self.width:len(self.metrics)].tolist()
+
+    def total(self, day: int, metric: str):
+        rls = [v for v in self.hourly(day, metric) if v == v]
+        return sum(rls) if rls else None
+
+    def peak(self, day: int, metric: str):
+        rls = [(v, h) for h, v in enumerate(self.hourly(day, metric)) if v == v]
+        if not rls:
+            return None, None
+        val, hour = max(rls)
+        return hour, val
+
+    def share(self, day: int, metric: str, fun):
+        rls = [v for v in self.hourly(day, metric) if v == v]
+        if not rls:
+            return None
+        return sum(1 for v in rls if fun(v)) / len(rls)
+
+    def week_delta(self, day: int, metric: str):
+        """Percent change of the last 7 days total against the 7 days before."""
+        cur = [self.total(day - i, metric) for i in range(7)]
+        pre = [self.total(day - i, metric) for i in range(7, 14)]
+        cur = sum(v for v in cur if v is not None)
+        pre = [v for v in pre if v is not None]
+        if not pre or not sum(pre):
+            return None
+        return round((cur - sum(pre)) / sum(pre) * 100, 1)
+
+    def as_dict(self):
+        return {
+            f'{day}': [None if v != v else v for v in self.values[slot * self.width:(slot + 1) * self.width]]
+            for slot, day in enumerate(self.slot_days)
+            if day
+        }
+
+    @classmethod
+    def from_dict(cls, dat: dict, **kwargs):
+        obj = cls(**kwargs)
+        for day, rls in (dat or {}).items():
+            if len(rls) != obj.width:
+                continue
+            slot = obj._slot(int(day), create=True)
+            if slot is None:
+                continue
+            pos = slot * obj.width
+            obj.values[pos:pos + obj.width] = array('d', [NAN if v is None else v for v in rls])
+        return obj
+
+
+class DepletionModel:
+    """Consumption rate of a draining level, smoothed over level steps, refills keep the learned rate."""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.level = None
+        self.since = None
+        self.rate = None
+        self.anchored = False
+
+    def add(self, ts: float, level: float):
+        """Returns True when the model changed, samples at an unchanged level are O(1) no-ops."""
+        if level is None:
+            return False
+        level = float(level)
+        if self.level is None or level > self.level:
+            # the first level may have started long ago, a refill is seen as it happens
+            self.anchored = self.level is not None
+            self.level, self.since = level, ts
+            return True
+        if level == self.level:
+            return False
+        if self.anchored and ts > self.since:
+            rate = (self.level - level) / ((ts - self.since) / DAY)
+            self.rate = rate if self.rate is None else self.rate + self.alpha * (rate - self.rate)
+        self.anchored = True
+        self.level, self.since = level, ts
+        return True
+
+    @property
+    def empty_at(self):
+        if not self.rate or self.rate <= 0 or self.level is None:
+            return None
+        return self.since + self.level / self.rate * DAY
+
+    def as_dict(self):
+        return {
+            'level': self.level,
+            'since': self.since,
+            'rate': self.rate,
+            'anchored': self.anchored,
+        }
+
+    @classmethod
+    def from_dict(cls, dat: dict, **kwargs):
+        obj = cls(**kwargs)
+        obj.level = dat.get('level')
+        obj.since = dat.get('since')
+        obj.rate = dat.get('rate')
+        obj.anchored = not not dat.get('anchored')
+        return obj
@@ -8,25 +8,17 @@ from homeassistant.components.switch import (
     DOMAIN as ENTITY_DOMAIN,
 )
 
-from . import (
-    DOMAIN,
-    PetkitBinaryEntity,
-    async_setup_accounts,
-)
+from . import async_setup_entities
+from .const import DOMAIN
+from .entity import PetkitBinaryEntity
 
 _LOGGER = logging.getLogger(__name__)
 
 DATA_KEY = f'{ENTITY_DOMAIN}.{DOMAIN}'
 
 
-async def async_setup_entry(hass, config_entry, async_add_entities):
-    cfg = {**config_entry.data, **config_entry.options}
-    await async_setup_platform(hass, cfg, async_setup_platform, async_add_entities)
-
-
-async def async_setup_platform(hass: HomeAssistant, config, async_add_entities, discovery_info=None):
-    hass.data[DOMAIN]['add_entities'][ENTITY_DOMAIN] = async_add_entities
-    await async_setup_accounts(hass, ENTITY_DOMAIN)
+async def async_setup_entry(hass: HomeAssistant, config_entry, async_add_entities):
+    await async_setup_entities(hass, config_entry, ENTITY_DOMAIN, async_add_entities)
 
 
 class PetkitSwitchEntity(PetkitBinaryEntity, SwitchEntity):
@@ -42,7 +34,7 @@ class PetkitSwitchEntity(PetkitBinaryEntity, SwitchEntity):
             self._attr_is_on = not not on
             self.async_write_ha_state()
             await asyncio.sleep(1)
-            self._handle_coordinator_update()
+            self.render_state()
         return ret
 
     async def async_turn_on(self, **kwargs):
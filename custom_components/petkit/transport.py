@@ -0,0 +1,154 @@
+"""Request transports for the Petkit API."""
+import time
+import zlib
+import asyncio
+import logging
+
+import aiohttp
+
+from aiohttp import ClientConnectorError, ClientError
+
+_LOGGER = logging.getLogger(__name__)
+
+LOCAL_TIMEOUT = 5
+RETRY_AFTER = 60
+PROBE_TIMEOUT = 5
+LATENCY_SMOOTHING = 0.3
+ACCEPT_ENCODING = 'gzip, deflate'
+# raised before the request reached the server, so sending it elsewhere cannot repeat it
+NOT_SENT_ERRORS = tuple(
+    err
+    for err in [ClientConnectorError, getattr(aiohttp, 'ConnectionTimeoutError', None)]
+    if err
+)
+
+
+def not_sent(exc):
+    return isinstance(exc, NOT_SENT_ERRORS)
+
+
+def decode_body(raw: bytes, encoding=None):
+    """Decompress a body read with auto_decompress disabled."""
+    encoding = (encoding or '').lower()
+    if encoding == 'gzip':
+        return zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(raw)
+        except zlib.error:
+            return zlib.decompress(raw, -zlib.MAX_WBITS)
+    return raw
+
+
+async def read_body(req):
+    raw = await req.read()
+    try:
+        body = decode_body(raw, req.headers.get('Content-Encoding'))
+    except zlib.error as exc:
+        raise ValueError(f'Invalid {req.headers.get("Content-Encoding")} body: {exc}') from exc
+    return raw, body
+
+
+class HttpTransport:
+    """Serves API calls from one HTTP base, the Petkit cloud or a local relay mirroring it."""
+
+    def __init__(self, account, base: str, name='cloud', timeout=30, strict=False):
+        self.account = account
+        self.base = base
+        self.name = name
+        self.timeout = timeout
+        self.strict = strict
+        self.latency = None
+        self._down_until = 0
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.name} {self.base}>'
+
+    def url(self, api=''):
+        if api[:6] == 'https:' or api[:5] == 'http:':
+            return api
+        return f"{self.base.rstrip('/')}/{api.lstrip('/')}"
+
+    @property
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def mark_down(self, seconds=RETRY_AFTER):
+        self.latency = None
+        self._down_until = time.monotonic() + seconds
+        _LOGGER.warning('Petkit %s transport unavailable, retry after %ss', self.name, seconds)
+
+    def record_latency(self, seconds: float):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += (seconds - self.latency) * LATENCY_SMOOTHING
+
+    async def probe(self):
+        """Measure the round-trip to the base, any HTTP response counts as reachable."""
+        tim = time.monotonic()
+        try:
+            req = await self.account.http.get(self.base, timeout=PROBE_TIMEOUT)
+            req.release()
+        except (ClientError, asyncio.TimeoutError) as exc:
+            _LOGGER.info('Probe petkit api base %s failed: %s', self.base, exc)
+            self.mark_down()
+            return None
+        self._down_until = 0
+        self.record_latency(time.monotonic() - tim)
+        return self.latency
+
+    async def request(self, method, api, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        tim = time.monotonic()
+        kwargs.setdefault('headers', {})['Accept-Encoding'] = ACCEPT_ENCODING
+        req = await self.account.http.request(method, self.url(api), **kwargs)
+        if self.strict:
+            req.raise_for_status()
+        raw, body = await read_body(req)
+        self.record_latency(time.monotonic() - tim)
+        self.account.record_traffic(api, len(raw), len(body))
+        return body
+
+
+class CloudBases:
+    """Several cloud API bases of one account, ordered by health and measured latency."""
+
+    def __init__(self, account, bases: list):
+        self.transports = [
+            HttpTransport(account, bas, 'cloud' if idx == 0 else f'cloud{idx}')
+            for idx, bas in enumerate(bases)
+        ]
+
+    @property
+    def best(self) -> HttpTransport:
+        return self.ordered()[0]
+
+    def ordered(self):
+        """Healthy bases fastest first, unknown latency keeps the configured order, unhealthy ones last."""
+        def key(tsp):
+            return (
+                not tsp.available,
+                tsp.latency is None,
+                tsp.latency or 0,
+            )
+        return sorted(self.transports, key=key)
+
+    async def async_probe(self, *args):
+        if len(self.transports) < 2:
+            return
+        await asyncio.gather(*[tsp.probe() for tsp in self.transports])
+        _LOGGER.debug('Petkit api bases: %s', self.diagnostics())
+
+    def diagnostics(self):
+        return {
+            'selected': self.best.base,
+            'bases': [
+                {
+                    'base': tsp.base,
+                    'available': tsp.available,
+                    'latency_ms': None if tsp.latency is None else round(tsp.latency * 1000, 1),
+                }
+                for tsp in self.transports
+            ],
+        }
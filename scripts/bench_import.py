@@ -0,0 +1,50 @@
+"""Measure the cold import cost of the integration modules.
+
+Run from the repository root in an environment with Home Assistant installed:
+
+    python scripts/bench_import.py [--runs 5]
+
+Each module is imported in a fresh interpreter with Home Assistant's core
+already loaded, so the numbers only cover what the integration itself adds.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    'custom_components.petkit',
+    'custom_components.petkit.config_flow',
+    'custom_components.petkit.api',
+    'custom_components.petkit.coordinator',
+    'custom_components.petkit.sensor',
+]
+
+SNIPPET = '''
+import time
+import homeassistant.core, homeassistant.helpers.config_validation
+t = time.perf_counter()
+import {module}
+print(time.perf_counter() - t)
+'''
+
+
+def measure(module, runs):
+    rls = []
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, '-c', SNIPPET.format(module=module)])
+        rls.append(float(out.decode().strip()) * 1000)
+    return rls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    for module in MODULES:
+        rls = measure(module, args.runs)
+        print(f'{module:45} median {statistics.median(rls):8.2f} ms  min {min(rls):8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Helpers for running the integration against local stand-ins of the Petkit servers."""
+import sys
+import asyncio
+import tempfile
+
+from pathlib import Path
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+from homeassistant import config_entries, loader
+from homeassistant.core import HomeAssistant
+from homeassistant.bootstrap import load_registries
+
+sys.path.insert(0, f'{Path(__file__).parents[1]}')
+
+from custom_components.petkit.const import DOMAIN  # noqa: E402
+
+
+def run(coro, timeout=20):
+    return asyncio.run(asyncio.wait_for(coro, timeout))
+
+
+@asynccontextmanager
+async def petkit_hass(config=None):
+    hass = HomeAssistant(tempfile.mkdtemp())
+    hass.data[DOMAIN] = {
+        'config': config or {},
+        'accounts': {},
+        'devices': {},
+        'coordinators': {},
+        'entries': {},
+    }
+    try:
+        yield hass
+    finally:
+        await hass.async_stop(force=True)
+
+
+async def setup_registries(hass):
+    """Config entries and the device and entity registries, as bootstrap sets them up."""
+    loader.async_setup(hass)
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    await hass.config_entries.async_initialize()
+    await load_registries(hass)
+
+
+@asynccontextmanager
+async def local_server(*routes):
+    """Serve the routes on a free local port, yields the base url."""
+    app = web.Application()
+    app.add_routes(list(routes))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,167 @@
+"""MQTT bridge publishing through the mqtt integration to a local broker stand-in."""
+import json
+import asyncio
+
+from pathlib import Path
+
+from aiohttp import web
+from homeassistant import config_entries
+
+from conftest import local_server, petkit_hass, run, setup_registries
+from custom_components.petkit.api import PetkitAccount
+from custom_components.petkit.coordinator import DevicesCoordinator, SharedDevices
+from custom_components.petkit.const import DOMAIN
+
+DID = 100012345
+
+
+class Broker:
+    """Just enough of MQTT 3.1.1 for one client: connect, subscribe, publish and ping."""
+
+    def __init__(self):
+        self.published = []
+        self.received = asyncio.Event()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.client, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def client(self, reader, writer):
+        try:
+            while True:
+                hdr = (await reader.readexactly(1))[0]
+                size, mul = 0, 1
+                while True:
+                    byt = (await reader.readexactly(1))[0]
+                    size += (byt & 0x7f) * mul
+                    mul *= 128
+                    if not byt & 0x80:
+                        break
+                body = await reader.readexactly(size)
+                typ = hdr >> 4
+                if typ == 1:
+                    writer.write(b'\x20\x02\x00\x00')
+                elif typ == 3:
+                    qos = hdr >> 1 & 3
+                    tln = int.from_bytes(body[:2], 'big')
+                    pos = 2 + tln
+                    if qos:
+                        writer.write(b'\x40\x02' + body[pos:pos + 2])
+                        pos += 2
+                    self.published.append((body[2:2 + tln].decode(), body[pos:], bool(hdr & 1)))
+                    self.received.set()
+                elif typ == 8:
+                    pos, grants = 2, b''
+                    while pos < size:
+                        pos += 2 + int.from_bytes(body[pos:pos + 2], 'big')
+                        grants += body[pos:pos + 1]
+                        pos += 1
+                    writer.write(bytes([0x90, 2 + len(grants)]) + body[:2] + grants)
+                elif typ == 10:
+                    writer.write(b'\xb0\x02' + body[:2])
+                elif typ == 12:
+                    writer.write(b'\xd0\x00')
+                elif typ == 14:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    def messages(self, topic):
+        return [
+            json.loads(pld)
+            for tpc, pld, _ in self.published
+            if tpc == topic
+        ]
+
+    async def wait_for(self, topic, check=bool):
+        while not any(check(msg) for msg in self.messages(topic)):
+            self.received.clear()
+            await self.received.wait()
+
+
+class Cloud:
+    def __init__(self):
+        self.records = [
+            {'eventType': 10, 'timestamp': 1700000000},
+            {'eventType': 5, 'timestamp': 1700000100},
+        ]
+
+    async def roster(self, request):
+        return web.json_response({'result': {'devices': [
+            {'type': 'T3', 'data': {'id': DID, 'name': 't3', 'state': 1}},
+        ]}})
+
+    async def detail(self, request):
+        return web.json_response({'result': {'id': DID}})
+
+    async def records_(self, request):
+        return web.json_response({'result': self.records})
+
+    def routes(self):
+        return [
+            web.get('/discovery/device_roster', self.roster),
+            web.get('/t3/device_detail', self.detail),
+            web.get('/t3/getDeviceRecord', self.records_),
+        ]
+
+
+async def setup_mqtt(hass, port):
+    hass.config.skip_pip = True
+    # mqtt reads its yaml items on setup
+    Path(hass.config.path('configuration.yaml')).touch()
+    await setup_registries(hass)
+    # the mqtt dependencies only serve its config panel
+    hass.config.components.update(['http', 'file_upload'])
+    entry = config_entries.ConfigEntry(
+        1, 'mqtt', 'mqtt', {'broker': '127.0.0.1', 'port': port, 'discovery': False}, config_entries.SOURCE_USER,
+    )
+    await hass.config_entries.async_add(entry)
+    assert entry.state is config_entries.ConfigEntryState.LOADED
+
+
+def test_events_in_the_first_detail_are_not_published():
+    cloud = Cloud()
+    broker = Broker()
+
+    async def main():
+        port = await broker.start()
+        async with local_server(*cloud.routes()) as api, petkit_hass() as hass:
+            await setup_mqtt(hass, port)
+            hass.data[DOMAIN]['registry'] = SharedDevices()
+            acc = PetkitAccount(hass, {
+                'username': 'u', 'password': 'p', 'token': 't', 'api_base': api, 'mqtt_topic': 'petkit',
+            })
+            coordinator = DevicesCoordinator(acc)
+            await coordinator.async_refresh()
+            await broker.wait_for(f'petkit/{DID}/detail', lambda msg: msg.get('records') == cloud.records)
+            assert broker.messages(f'petkit/{DID}/data')[-1]['id'] == DID
+            assert all(ret for tpc, _, ret in broker.published if tpc.startswith('petkit/'))
+
+            dvc = hass.data[DOMAIN]['devices'][DID]
+            # an entity that does not use the optional records, the bridge still needs them
+            dvc.consumers['sensor.t3_state'] = ['detail']
+            cloud.records = [*cloud.records, {'eventType': 10, 'timestamp': 1700000200}]
+            await coordinator.async_refresh()
+            await broker.wait_for(f'petkit/{DID}/event')
+            # the records of the first detail are history, only the new one is an event
+            assert broker.messages(f'petkit/{DID}/event') == [{'type': 'record', **cloud.records[-1]}]
+            assert broker.messages(f'petkit/{DID}/detail')[-1]['records'] == cloud.records
+
+            coordinator.retire_device(DID)
+            assert coordinator.bridge._marks == {}
+            assert coordinator.bridge._digests == {}
+            assert 'mqtt_bridge' not in dvc.consumers
+
+            coordinator._unschedule_refresh()
+            coordinator.unload_devices()
+            await acc.async_close()
+        await broker.stop()
+
+    run(main())
@@ -0,0 +1,38 @@
+"""Traffic capture and replay."""
+import json
+import asyncio
+
+from aiohttp import web
+
+from conftest import local_server, petkit_hass, run
+from custom_components.petkit.api import PetkitAccount
+
+
+def test_capture_then_replay_concurrently():
+    async def roster(request):
+        await asyncio.sleep(0.2)
+        return web.json_response({'result': {'devices': [{'type': 'D4', 'data': {'id': 1}}]}})
+
+    async def main():
+        async with local_server(web.get('/discovery/device_roster', roster)) as api, petkit_hass() as hass:
+            cfg = {'username': 'u', 'password': 'p', 'api_base': api, 'max_requests': 1}
+            acc = PetkitAccount(hass, {**cfg, 'capture': 'capture.jsonl'})
+            rls = await asyncio.gather(*[acc.get_devices() for _ in range(3)])
+            assert all(r == [{'type': 'D4', 'data': {'id': 1}}] for r in rls)
+            await acc.async_close()
+            # queueing behind max_requests is not part of the captured latency
+            with open(hass.config.path('capture.jsonl')) as fp:
+                rows = [json.loads(line) for line in fp]
+            assert len(rows) == 3
+            assert all(row['elapsed'] < 0.35 for row in rows)
+
+            rep = PetkitAccount(hass, {**cfg, 'replay': 'capture.jsonl', 'replay_speed': 0})
+            loads = []
+            load = rep.replay.load
+            rep.replay.load = lambda: loads.append(1) or load()
+            rls = await asyncio.gather(*[rep.get_devices() for _ in range(3)])
+            assert all(r == [{'type': 'D4', 'data': {'id': 1}}] for r in rls)
+            assert loads == [1]
+            await rep.async_close()
+
+    run(main())
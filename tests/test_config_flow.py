@@ -0,0 +1,37 @@
+"""Options flow validation."""
+import pytest
+import voluptuous as vol
+import voluptuous_serialize
+
+from homeassistant import config_entries
+from homeassistant.helpers import config_validation as cv
+
+from conftest import petkit_hass, run
+from custom_components.petkit.config_flow import PetkitOptionsFlow
+from custom_components.petkit.const import DOMAIN
+
+
+def test_options_bound_scan_interval_and_validate_feeding_amount():
+    async def main():
+        async with petkit_hass() as hass:
+            entry = config_entries.ConfigEntry(1, DOMAIN, 'u', {'username': 'u'}, config_entries.SOURCE_USER)
+            flow = PetkitOptionsFlow(entry)
+            flow.hass = hass
+            frm = await flow.async_step_init()
+            # the form is rendered by the frontend from the serialized schema
+            voluptuous_serialize.convert(frm['data_schema'], custom_serializer=cv.custom_serializer)
+            schema = frm['data_schema']
+            assert schema({'scan_interval': 60})['scan_interval'] == 60
+            for itv in [0, 1, 59]:
+                with pytest.raises(vol.Invalid):
+                    schema({'scan_interval': itv})
+
+            ret = await flow.async_step_init({'scan_interval': 120, 'feeding_amount': '20'})
+            assert ret['data']['feeding_amount'] == 20
+            ret = await flow.async_step_init({'scan_interval': 120, 'feeding_amount': 'input_number.amount'})
+            assert ret['data']['feeding_amount'] == 'input_number.amount'
+            for amt in ['twenty', '0', 'sensor.amount']:
+                ret = await flow.async_step_init({'scan_interval': 120, 'feeding_amount': amt})
+                assert ret['errors'] == {'feeding_amount': 'invalid_feeding_amount'}, amt
+
+    run(main())
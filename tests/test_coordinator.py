@@ -0,0 +1,252 @@
+"""Coordinator cycles against a local cloud stand-in."""
+import logging
+import functools
+
+from aiohttp import web
+from homeassistant import config_entries
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.entity_component import EntityComponent
+from homeassistant.util import dt as dt_util
+
+from conftest import local_server, petkit_hass, run, setup_registries
+from custom_components.petkit.api import PetkitAccount
+from custom_components.petkit.coordinator import DevicesCoordinator, SharedDevices
+from custom_components.petkit.const import DOMAIN, ROSTER_MISSING_LIMIT
+
+DEVICES = [100012345, 100012346]
+
+
+class Cloud:
+    def __init__(self):
+        self.details = []
+        self.devices = list(DEVICES)
+
+    async def roster(self, request):
+        return web.json_response({'result': {'devices': [
+            {'type': 'W5', 'data': {'id': did, 'name': f'w5 {did}', 'state': 1}}
+            for did in self.devices
+        ]}})
+
+    async def detail(self, request):
+        self.details.append(int(request.query['id']))
+        return web.json_response({'result': {'id': int(request.query['id'])}})
+
+    def routes(self):
+        return [
+            web.get('/discovery/device_roster', self.roster),
+            web.get('/w5/device_detail', self.detail),
+        ]
+
+
+def test_slots_are_kept_and_requested_refresh_fetches_details():
+    cloud = Cloud()
+
+    async def main():
+        async with local_server(*cloud.routes()) as api, petkit_hass() as hass:
+            hass.data[DOMAIN]['registry'] = SharedDevices()
+            acc = PetkitAccount(hass, {'username': 'u', 'password': 'p', 'token': 't', 'api_base': api})
+            coordinator = DevicesCoordinator(acc)
+            await coordinator.async_refresh()
+            assert sorted(cloud.details) == DEVICES
+            coordinator._unschedule_refresh()
+
+            cloud.details.clear()
+            await coordinator._handle_refresh_interval()
+            assert cloud.details == []
+            slots = dict(coordinator._slots)
+            assert sorted(slots) == DEVICES
+            await coordinator._handle_refresh_interval()
+            # pending slots are not pushed back by another cycle
+            assert coordinator._slots == slots
+
+            await coordinator.async_refresh()
+            assert sorted(cloud.details) == DEVICES
+            assert coordinator._slots == {}
+            coordinator._unschedule_refresh()
+            coordinator.unload_devices()
+            await acc.async_close()
+
+    run(main())
+
+
+def test_released_device_is_detached_until_adopted():
+    plans = []
+
+    async def roster(request):
+        return web.json_response({'result': {'devices': [
+            {'type': 'D4', 'data': {'id': DEVICES[0], 'name': 'd4', 'state': 1}},
+        ]}})
+
+    async def detail(request):
+        return web.json_response({'result': {'id': DEVICES[0], 'state': {'feedState': {'times': 1}}}})
+
+    async def plan(request):
+        plans.append(request.query['days'])
+        return web.json_response({'result': [{'items': [{'time': 43200}]}]})
+
+    async def main():
+        routes = [
+            web.get('/discovery/device_roster', roster),
+            web.get('/d4/device_detail', detail),
+            web.get('/d4/dailyFeeds', plan),
+        ]
+        async with local_server(*routes) as api, petkit_hass() as hass:
+            hass.data[DOMAIN]['registry'] = SharedDevices()
+            one = DevicesCoordinator(PetkitAccount(hass, {'username': 'a', 'token': 't', 'api_base': api}))
+            two = DevicesCoordinator(PetkitAccount(hass, {'username': 'b', 'token': 't', 'api_base': api}))
+            await one.async_refresh()
+            await two.async_refresh()
+            dvc = hass.data[DOMAIN]['devices'][DEVICES[0]]
+            assert dvc.coordinator is one and dvc._plan_unsub
+            assert len(plans) == 1
+
+            one.unload_devices()
+            await one.account.async_close()
+            assert dvc.coordinator is None
+            assert dvc._plan_unsub is None
+            # controls in the window before adoption are dropped instead of raising on the closed session
+            assert await dvc.feeding_now() is False
+
+            await two.async_refresh()
+            assert dvc.coordinator is two and dvc.account is two.account
+            assert dvc._plan_unsub and len(plans) == 2
+
+            for coordinator in [one, two]:
+                coordinator._unschedule_refresh()
+            two.unload_devices()
+            await two.account.async_close()
+
+    run(main())
+
+
+def test_retired_device_leaves_the_device_registry():
+    cloud = Cloud()
+
+    async def main():
+        async with local_server(*cloud.routes()) as api, petkit_hass() as hass:
+            await setup_registries(hass)
+            entry = config_entries.ConfigEntry(1, DOMAIN, 'u', {}, config_entries.SOURCE_USER)
+            hass.config_entries._entries[entry.entry_id] = entry
+            config_entries.current_entry.set(entry)
+            dev_reg = dr.async_get(hass)
+            for did in DEVICES:
+                dev_reg.async_get_or_create(config_entry_id=entry.entry_id, identifiers={(DOMAIN, f'w5_{did}')})
+            hass.data[DOMAIN]['registry'] = SharedDevices()
+            acc = PetkitAccount(hass, {'username': 'u', 'password': 'p', 'token': 't', 'api_base': api})
+            coordinator = DevicesCoordinator(acc)
+            await coordinator.async_refresh()
+
+            cloud.devices = DEVICES[:1]
+            for _ in range(ROSTER_MISSING_LIMIT):
+                await coordinator.async_refresh()
+            assert list(coordinator.devices) == DEVICES[:1]
+            assert dev_reg.async_get_device(identifiers={(DOMAIN, f'w5_{DEVICES[0]}')})
+            assert dev_reg.async_get_device(identifiers={(DOMAIN, f'w5_{DEVICES[1]}')}) is None
+
+            coordinator._unschedule_refresh()
+            coordinator.unload_devices()
+            await acc.async_close()
+
+    run(main())
+
+
+def test_feeding_re_renders_the_sensors():
+    state = {'times': 2}
+
+    async def roster(request):
+        return web.json_response({'result': {'devices': [
+            {'type': 'D4', 'data': {'id': DEVICES[0], 'name': 'd4', 'state': 1}},
+        ]}})
+
+    async def detail(request):
+        return web.json_response({'result': {'id': DEVICES[0], 'state': {'feedState': {'times': state['times']}}}})
+
+    async def plan(request):
+        return web.json_response({'result': []})
+
+    async def feed(request):
+        state['times'] += 1
+        return web.json_response({'result': 'success'})
+
+    async def main():
+        routes = [
+            web.get('/discovery/device_roster', roster),
+            web.get('/d4/device_detail', detail),
+            web.get('/d4/dailyFeeds', plan),
+            web.get('/d4/saveDailyFeed', feed),
+        ]
+        async with local_server(*routes) as api, petkit_hass() as hass:
+            await setup_registries(hass)
+            hass.data[DOMAIN]['registry'] = SharedDevices()
+            acc = PetkitAccount(hass, {'username': 'u', 'token': 't', 'api_base': api})
+            coordinator = DevicesCoordinator(acc)
+            components = {}
+            for domain in ['sensor', 'switch']:
+                components[domain] = EntityComponent(logging.getLogger(__name__), domain, hass)
+                coordinator.add_entities[domain] = functools.partial(add_entities, hass, components[domain])
+            await coordinator.async_refresh()
+            await hass.async_block_till_done()
+            eid = f'sensor.d4_{DEVICES[0]}_feed_times'
+            assert hass.states.get(eid).state == '2'
+
+            await components['switch'].get_entity(f'switch.d4_{DEVICES[0]}_feeding').async_turn_on()
+            await coordinator.async_refresh()
+            await hass.async_block_till_done()
+            assert hass.states.get(eid).state == '3'
+
+            coordinator._unschedule_refresh()
+            coordinator.unload_devices()
+            await acc.async_close()
+
+    run(main())
+
+
+def add_entities(hass, component, entities):
+    hass.async_create_task(component.async_add_entities(entities))
+
+
+def test_feeding_and_plan_use_the_home_assistant_day():
+    days = {}
+
+    async def roster(request):
+        return web.json_response({'result': {'devices': [
+            {'type': 'D4', 'data': {'id': DEVICES[0], 'name': 'd4', 'state': 1}},
+        ]}})
+
+    async def detail(request):
+        return web.json_response({'result': {'id': DEVICES[0]}})
+
+    async def plan(request):
+        days['plan'] = request.query['days']
+        return web.json_response({'result': []})
+
+    async def feed(request):
+        days['feed'] = request.query['day']
+        return web.json_response({'result': 'success'})
+
+    async def main():
+        routes = [
+            web.get('/discovery/device_roster', roster),
+            web.get('/d4/device_detail', detail),
+            web.get('/d4/dailyFeeds', plan),
+            web.get('/d4/saveDailyFeed', feed),
+        ]
+        async with local_server(*routes) as api, petkit_hass() as hass:
+            hass.data[DOMAIN]['registry'] = SharedDevices()
+            coordinator = DevicesCoordinator(PetkitAccount(hass, {'username': 'u', 'token': 't', 'api_base': api}))
+            await coordinator.async_refresh()
+            dvc = hass.data[DOMAIN]['devices'][DEVICES[0]]
+            await dvc.feeding_now()
+            assert days == {'plan': dt_util.now().strftime('%Y%m%d'), 'feed': dt_util.now().strftime('%Y%m%d')}
+
+            coordinator._unschedule_refresh()
+            coordinator.unload_devices()
+            await coordinator.account.async_close()
+
+    # a day ahead of the host for most of the day, whatever the timezone of the host
+    old = dt_util.DEFAULT_TIME_ZONE
+    dt_util.set_default_time_zone(dt_util.get_time_zone('Pacific/Kiritimati'))
+    try:
+        run(main())
+    finally:
+        dt_util.set_default_time_zone(old)
@@ -0,0 +1,105 @@
+"""Push transports against a local fake event server."""
+import json
+import asyncio
+
+from aiohttp import web
+
+from conftest import local_server, petkit_hass, run
+from custom_components.petkit.api import PetkitAccount
+from custom_components.petkit.push import LONG_POLL_HOLD, LongPollTransport, WebsocketTransport
+
+
+def account(hass, url):
+    return PetkitAccount(hass, {'username': 'u', 'password': 'p', 'push_url': url})
+
+
+async def collect(acc, count):
+    evs = []
+    got = asyncio.Event()
+
+    def on_event(did, evt):
+        evs.append((did, evt))
+        if len(evs) >= count:
+            got.set()
+
+    acc.push.add_event_listener(on_event)
+    acc.push.start()
+    await asyncio.wait_for(got.wait(), 5)
+    return evs
+
+
+def test_websocket_skips_invalid_message():
+    connects = []
+
+    async def events(request):
+        connects.append(request)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str('{not json')
+        await ws.send_str(json.dumps({'events': [{'deviceId': 1, 'type': 'feed'}]}))
+        await ws.send_str(json.dumps({'deviceId': 2}))
+        await asyncio.sleep(5)
+        return ws
+
+    async def main():
+        async with local_server(web.get('/events', events)) as url, petkit_hass() as hass:
+            acc = account(hass, url.replace('http:', 'ws:') + '/events')
+            assert isinstance(acc.push, WebsocketTransport)
+            evs = await collect(acc, 2)
+            assert [did for did, evt in evs] == [1, 2]
+            assert acc.push.connected
+            assert len(connects) == 1
+            await acc.async_close()
+
+    run(main())
+
+
+def test_long_poll_cursor_and_invalid_body():
+    seen = []
+
+    async def poll(request):
+        seen.append(request.query.get('cursor'))
+        if len(seen) == 1:
+            return web.json_response({'cursor': 'a', 'events': [{'deviceId': 1}]})
+        if len(seen) == 2:
+            # held like a real long poll, instant empty replies are backed off
+            await asyncio.sleep(LONG_POLL_HOLD)
+            return web.Response(text='<html>busy</html>')
+        if len(seen) == 3:
+            return web.json_response({'cursor': 'b', 'events': [{'deviceId': 2}]})
+        await asyncio.sleep(5)
+        return web.json_response({})
+
+    async def main():
+        async with local_server(web.get('/poll', poll)) as url, petkit_hass() as hass:
+            acc = account(hass, url + '/poll')
+            assert isinstance(acc.push, LongPollTransport)
+            evs = await collect(acc, 2)
+            assert [did for did, evt in evs] == [1, 2]
+            assert seen[:3] == [None, 'a', 'a']
+            await acc.async_close()
+
+    run(main())
+
+
+def test_long_poll_backs_off_instant_empty_replies():
+    seen = []
+
+    async def poll(request):
+        seen.append(request.query.get('cursor'))
+        return web.json_response({'cursor': 'a', 'events': []})
+
+    async def main():
+        async with local_server(web.get('/poll', poll)) as url, petkit_hass() as hass:
+            acc = account(hass, url + '/poll')
+            status = []
+            acc.push.add_status_listener(status.append)
+            acc.push.start()
+            await asyncio.sleep(2)
+            assert 1 <= len(seen) <= 2
+            # an instant empty reply is no healthy push channel
+            assert not acc.push.connected
+            assert status == []
+            await acc.async_close()
+
+    run(main())
@@ -0,0 +1,228 @@
+"""Rolling statistics against brute-force recomputation."""
+import json
+import random
+
+import pytest
+
+from custom_components.petkit.stats import DAY, ORIGIN, DepletionModel, HourlySeries, SampleSeries
+
+NOW = 1.7e9
+
+
+def brute_stats(samples, capacity, days, now):
+    floor = (now - ORIGIN) / DAY - days
+    kept = [
+        ((ts - ORIGIN) / DAY, val)
+        for ts, val in samples[-capacity:]
+        if (ts - ORIGIN) / DAY >= floor
+    ]
+    if not kept:
+        return {}
+    n = len(kept)
+    mx = sum(x for x, y in kept) / n
+    my = sum(y for x, y in kept) / n
+    sxx = sum((x - mx) ** 2 for x, y in kept)
+    sxy = sum((x - mx) * (y - my) for x, y in kept)
+    return {
+        'mean': my,
+        'min': min(y for x, y in kept),
+        'max': max(y for x, y in kept),
+        'slope': sxy / sxx if n > 1 and sxx > 1e-12 else 0.0,
+        'count': n,
+    }
+
+
+def assert_stats(got, exp):
+    assert got.keys() == exp.keys()
+    if not exp:
+        return
+    assert got['count'] == exp['count']
+    assert got['min'] == exp['min']
+    assert got['max'] == exp['max']
+    assert got['mean'] == pytest.approx(exp['mean'], abs=0.051)
+    assert got['slope'] == pytest.approx(exp['slope'], abs=0.006, rel=1e-6)
+
+
+def random_samples(count, seed):
+    rnd = random.Random(seed)
+    ts = NOW
+    rls = []
+    for _ in range(count):
+        # from minutes to almost two days apart, so windows expire as well as wrap
+        ts += rnd.uniform(60, 1.8 * DAY)
+        rls.append((ts, round(rnd.uniform(3000, 6000), 1)))
+    return rls
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_sample_series_matches_brute_force_across_wraparound(seed):
+    capacity = 16
+    ser = SampleSeries(capacity=capacity, windows=(1, 7))
+    samples = random_samples(200, seed)
+    for idx, (ts, val) in enumerate(samples):
+        assert ser.add(ts, val)
+        for days in (1, 7):
+            assert_stats(ser.stats(days), brute_stats(samples[:idx + 1], capacity, days, ts))
+
+
+def test_sample_series_rejects_stale_samples():
+    ser = SampleSeries(capacity=4, windows=(7,))
+    assert ser.add(NOW, 5)
+    assert not ser.add(NOW, 6)
+    assert not ser.add(NOW - 1, 6)
+    assert ser.stats(7)['count'] == 1
+
+
+def test_sample_series_windows_expire_without_new_samples():
+    ser = SampleSeries(capacity=64, windows=(1, 7))
+    samples = random_samples(30, 7)
+    for ts, val in samples:
+        ser.add(ts, val)
+    last = samples[-1][0]
+    for later in [last + DAY / 2, last + 2 * DAY, last + 6 * DAY, last + 8 * DAY]:
+        for days in (1, 7):
+            assert_stats(ser.stats(days, later), brute_stats(samples, 64, days, later))
+    assert ser.stats(7, last + 8 * DAY) == {}
+
+
+def test_sample_series_round_trip():
+    capacity = 16
+    ser = SampleSeries(capacity=capacity, windows=(1, 7))
+    samples = random_samples(40, 11)
+    for ts, val in samples:
+        ser.add(ts, val)
+    dat = ser.as_dict()
+    assert len(dat['times']) == capacity
+    assert dat['times'] == pytest.approx([ts for ts, val in samples[-capacity:]], abs=1e-3)
+    assert dat['values'] == [val for ts, val in samples[-capacity:]]
+
+    new = SampleSeries.from_dict(dat, capacity=capacity, windows=(1, 7))
+    assert new.as_dict() == dat
+    for days in (1, 7):
+        assert new.stats(days) == ser.stats(days)
+    ts, val = samples[-1][0] + 3600, 4500.0
+    assert new.add(ts, val) and ser.add(ts, val)
+    for days in (1, 7):
+        assert new.stats(days) == ser.stats(days)
+
+
+def hourly_rows(rnd):
+    return [
+        {'activity': rnd.randint(0, 500), 'sleep': rnd.choice([None, rnd.randint(0, 60)])}
+        for _ in range(24)
+    ]
+
+
+def test_hourly_series_reuses_the_slot_of_the_oldest_day():
+    ser = HourlySeries(('activity', 'sleep'), days=3)
+    assert ser.put(100, 5, {'activity': 10, 'sleep': 20})
+    assert not ser.put(100, 5, {'activity': 10, 'sleep': 20})
+    assert ser.put(101, 6, {'activity': 11})
+    # day 103 takes the slot of day 100, which is cleared
+    assert ser.put(103, 7, {'activity': 13})
+    assert ser.hourly(100, 'activity') == []
+    assert ser.total(100, 'activity') is None
+    assert ser.total(101, 'activity') == 11
+    hrs = ser.hourly(103, 'activity')
+    assert hrs[7] == 13 and all(v != v for h, v in enumerate(hrs) if h != 7)
+    assert ser.total(103, 'sleep') is None
+    # the dropped day cannot come back over a newer one
+    assert not ser.put(100, 5, {'activity': 99})
+    assert ser.total(103, 'activity') == 13
+    assert not ser.put(103, 24, {'activity': 1})
+
+
+def test_hourly_series_week_delta_matches_brute_force():
+    rnd = random.Random(3)
+    ser = HourlySeries(('activity', 'sleep'), days=14)
+    totals = {}
+    for day in range(1000, 1030):
+        if rnd.random() < 0.2:
+            # a day without data, left out of both weeks
+            continue
+        rows = hourly_rows(rnd)
+        for hour, row in enumerate(rows):
+            ser.put(day, hour, row)
+        totals[day] = sum(row['activity'] for row in rows)
+        cur = sum(totals.get(day - i, 0) for i in range(7))
+        pre = [totals[day - i] for i in range(7, 14) if day - i in totals]
+        exp = round((cur - sum(pre)) / sum(pre) * 100, 1) if pre and sum(pre) else None
+        assert ser.week_delta(day, 'activity') == exp
+        assert ser.total(day, 'activity') == totals[day]
+        assert ser.peak(day, 'activity') == max((v['activity'], h) for h, v in enumerate(rows))[::-1]
+    assert ser.week_delta(5000, 'activity') is None
+
+
+def test_hourly_series_round_trip():
+    rnd = random.Random(5)
+    ser = HourlySeries(('activity', 'sleep'), days=7)
+    for day in range(200, 210):
+        for hour, row in enumerate(hourly_rows(rnd)):
+            ser.put(day, hour, row)
+    dat = json.loads(json.dumps(ser.as_dict()))
+    assert sorted(dat) == [f'{day}' for day in range(203, 210)]
+    new = HourlySeries.from_dict(dat, metrics=('activity', 'sleep'), days=7)
+    assert new.as_dict() == ser.as_dict()
+    for day in range(203, 210):
+        for metric in ('activity', 'sleep'):
+            assert new.total(day, metric) == ser.total(day, metric)
+    # rows of another width are skipped, older days never replace newer ones
+    new = HourlySeries.from_dict({**dat, '202': [1.0] * 48, '196': [1.0] * 12}, metrics=('activity', 'sleep'), days=7)
+    assert new.as_dict() == ser.as_dict()
+    assert HourlySeries.from_dict(dat, metrics=('activity',), days=7).as_dict() == {}
+
+
+def test_depletion_first_level_is_not_a_rate_anchor():
+    mdl = DepletionModel()
+    assert not mdl.add(NOW, None)
+    assert mdl.add(NOW, 80)
+    # the first level may have been reached long before, no rate from it
+    assert mdl.add(NOW + DAY, 70)
+    assert mdl.rate is None and mdl.anchored
+    assert mdl.empty_at is None
+    assert not mdl.add(NOW + 1.5 * DAY, 70)
+    assert mdl.add(NOW + 3 * DAY, 60)
+    assert mdl.rate == pytest.approx(5)
+    assert (mdl.level, mdl.since) == (60, NOW + 3 * DAY)
+    assert mdl.empty_at == pytest.approx(NOW + 3 * DAY + 12 * DAY)
+
+
+def test_depletion_rate_is_smoothed():
+    mdl = DepletionModel(alpha=0.5)
+    for ts, lvl in [(0, 100), (DAY, 90), (2 * DAY, 80), (3 * DAY, 60)]:
+        mdl.add(NOW + ts, lvl)
+    # 10 per day, then a step of 20 in a day half way in
+    assert mdl.rate == pytest.approx(15)
+    assert mdl.empty_at == pytest.approx(NOW + 3 * DAY + 4 * DAY)
+
+
+def test_depletion_refill_keeps_the_rate_and_re_anchors():
+    mdl = DepletionModel(alpha=0.5)
+    for ts, lvl in [(0, 50), (DAY, 40), (2 * DAY, 30)]:
+        mdl.add(NOW + ts, lvl)
+    assert mdl.rate == pytest.approx(10)
+    assert mdl.add(NOW + 2.5 * DAY, 100)
+    assert mdl.rate == pytest.approx(10)
+    assert (mdl.level, mdl.since, mdl.anchored) == (100, NOW + 2.5 * DAY, True)
+    assert mdl.empty_at == pytest.approx(NOW + 12.5 * DAY)
+    # a refill is seen as it happens, the next step is measured from it
+    assert mdl.add(NOW + 3 * DAY, 95)
+    assert mdl.rate == pytest.approx(10)
+    assert mdl.add(NOW + 4.5 * DAY, 65)
+    assert mdl.rate == pytest.approx(15)
+
+
+def test_depletion_empty_at_needs_a_draining_rate():
+    mdl = DepletionModel()
+    assert mdl.empty_at is None
+    mdl.add(NOW, 10)
+    mdl.add(NOW + DAY, 8)
+    mdl.add(NOW + DAY, 6)
+    # samples at the same time give no rate
+    assert mdl.empty_at is None
+    mdl.add(NOW + 2 * DAY, 4)
+    assert mdl.rate == pytest.approx(2)
+    assert mdl.empty_at == pytest.approx(NOW + 4 * DAY)
+    new = DepletionModel.from_dict(json.loads(json.dumps(mdl.as_dict())))
+    assert new.as_dict() == mdl.as_dict()
+    assert new.empty_at == mdl.empty_at
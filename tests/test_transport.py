@@ -0,0 +1,118 @@
+"""Request routing against local stand-ins of the relay and the cloud."""
+import socket
+import asyncio
+
+from aiohttp import web
+
+from conftest import local_server, petkit_hass, run
+from custom_components.petkit.api import PetkitAccount
+
+DEVICE = 100012345
+
+
+def free_url():
+    # a port nothing listens on, connecting to it is refused
+    with socket.socket() as sck:
+        sck.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sck.getsockname()[1]}/'
+
+
+class StandIn:
+    """Counts the calls of each api and answers like the Petkit cloud."""
+
+    def __init__(self, name, delay=0, status=200):
+        self.name = name
+        self.delay = delay
+        self.status = status
+        self.calls = []
+
+    async def handle(self, request):
+        self.calls.append(request.match_info['api'])
+        await asyncio.sleep(self.delay)
+        if self.status != 200:
+            return web.Response(status=self.status)
+        return web.json_response({'result': {'via': self.name}})
+
+    def route(self):
+        return web.get('/{api:.*}', self.handle)
+
+
+def account(hass, cloud, local):
+    acc = PetkitAccount(hass, {
+        'username': 'u',
+        'password': 'p',
+        'api_base': cloud,
+        'local_url': local,
+    })
+    acc.transports['local'].timeout = 0.3
+    return acc
+
+
+def test_relay_serves_device_requests():
+    relay, cloud = StandIn('relay'), StandIn('cloud')
+
+    async def main():
+        async with local_server(relay.route()) as loc, local_server(cloud.route()) as api, petkit_hass() as hass:
+            acc = account(hass, api, loc)
+            rsp = await acc.request('d4/device_detail', {'id': DEVICE}, device=DEVICE)
+            assert rsp['result']['via'] == 'relay'
+            rsp = await acc.request('discovery/device_roster')
+            assert rsp['result']['via'] == 'cloud'
+            assert relay.calls == ['d4/device_detail']
+            assert cloud.calls == ['discovery/device_roster']
+            await acc.async_close()
+
+    run(main())
+
+
+def test_unreachable_relay_falls_back_to_cloud():
+    cloud = StandIn('cloud')
+
+    async def main():
+        async with local_server(cloud.route()) as api, petkit_hass() as hass:
+            acc = account(hass, api, free_url())
+            rsp = await acc.request('d4/saveDailyFeed', {'deviceId': DEVICE}, device=DEVICE)
+            assert rsp['result']['via'] == 'cloud'
+            assert cloud.calls == ['d4/saveDailyFeed']
+            assert not acc.transports['local'].available
+            await acc.async_close()
+
+    run(main())
+
+
+def test_command_sent_to_relay_is_never_repeated():
+    async def main():
+        for relay in [StandIn('relay', delay=1), StandIn('relay', status=502)]:
+            cloud = StandIn('cloud')
+            async with local_server(relay.route()) as loc, local_server(cloud.route()) as api, petkit_hass() as hass:
+                acc = account(hass, api, loc)
+                rsp = await acc.request('d4/saveDailyFeed', {'deviceId': DEVICE}, device=DEVICE)
+                assert rsp == {}
+                assert relay.calls == ['d4/saveDailyFeed']
+                assert cloud.calls == []
+                # later calls skip the failing relay
+                rsp = await acc.request('d4/device_detail', {'id': DEVICE}, device=DEVICE)
+                assert rsp['result']['via'] == 'cloud'
+                await acc.async_close()
+
+    run(main())
+
+
+def test_cloud_failover_repeats_only_reads():
+    async def main():
+        primary, secondary = StandIn('primary', delay=1), StandIn('secondary')
+        async with local_server(primary.route()) as one, local_server(secondary.route()) as two, petkit_hass() as hass:
+            acc = PetkitAccount(hass, {'username': 'u', 'password': 'p', 'api_base': [one, two]})
+            acc.cloud.transports[0].timeout = 0.3
+            rsp = await acc.request('d4/saveDailyFeed', {'deviceId': DEVICE})
+            assert rsp == {}
+            assert secondary.calls == []
+            # the slow primary is skipped until it is probed healthy again
+            acc.cloud.transports[0]._down_until = 0
+            rsp = await acc.get_devices()
+            assert rsp == []
+            assert primary.calls == ['d4/saveDailyFeed', 'discovery/device_roster']
+            assert secondary.calls == ['discovery/device_roster']
+            await acc.async_close()
+
+    run(main())